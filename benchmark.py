@@ -0,0 +1,278 @@
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Callable
+
+from main import DataSet, Vacancy, CompactVacancy, RecordSchema, ColumnsCache, ReportTable, ReportGraphic, ChartTemplate
+from main import VacancyFile, YearPartitions
+
+HEADERS = ['name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at']
+
+NAMES = ['Программист Python', 'Java разработчик', 'Аналитик', 'Системный аналитик', 'Data Scientist',
+         'Менеджер по продажам', 'Бухгалтер', 'Водитель', 'Инженер-программист', 'Программист 1С',
+         'Frontend-разработчик', 'Тестировщик', 'Оператор call-центра', 'Продавец-консультант', 'Юрист']
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород',
+          'Краснодар', 'Самара', 'Ростов-на-Дону', 'Воронеж', 'Уфа', 'Пермь', 'Челябинск', 'Омск', 'Минск',
+          'Алматы'] + [f'Город {index}' for index in range(300)]
+CURRENCIES = ['RUR', 'USD', 'EUR', 'KZT', 'UAH', 'BYR', 'AZN', 'GEL', 'KGS', 'UZS']
+CURRENCY_WEIGHTS = [90, 3, 2, 1.5, 1, 1, 0.5, 0.4, 0.3, 0.3]
+FIRST_YEAR, LAST_YEAR = 2007, 2022
+HEAVY_MODULES = ['numpy', 'matplotlib', 'openpyxl']
+
+
+def generate_vacancies(file_name: str, count_rows: int, seed: int = 0):
+    """Генерирует синтетическую выгрузку вакансий с заголовками настоящих выгрузок.
+
+    Города распределены по закону Ципфа, большинство окладов в рублях, около 5% строк с пустыми полями,
+    названия вакансий иногда содержат запятые и переводы строк, даты публикации идут по возрастанию.
+
+    :param file_name: Имя файла.
+    :param count_rows: Количество строк.
+    :param seed: Зерно генератора случайных чисел.
+    """
+    rnd = random.Random(seed)
+    city_weights = [1 / (rank + 1) for rank in range(len(CITIES))]
+    names = NAMES + ['Менеджер, продажи', 'Инженер\nпрограммист']
+    batch_size = 100_000
+    with open(file_name, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADERS)
+        for start in range(0, count_rows, batch_size):
+            size = min(batch_size, count_rows - start)
+            cities = rnd.choices(CITIES, city_weights, k=size)
+            currencies = rnd.choices(CURRENCIES, CURRENCY_WEIGHTS, k=size)
+            rows = []
+            for index in range(size):
+                year = FIRST_YEAR + (start + index) * (LAST_YEAR - FIRST_YEAR + 1) // count_rows
+                salary_from = rnd.randint(10, 300) * 1000
+                row = [rnd.choice(names), f'{salary_from}.0', f'{salary_from + rnd.randint(0, 100) * 1000}.0',
+                       currencies[index], cities[index],
+                       f'{year}-{rnd.randint(1, 12):02}-{rnd.randint(1, 28):02}T{rnd.randint(0, 23):02}:00:00+0300']
+                if rnd.random() < 0.05:
+                    row[rnd.randint(1, len(row) - 1)] = ''
+                rows.append(row)
+            writer.writerows(rows)
+
+
+def timed(phases: Dict[str, float], phase: str, function: Callable):
+    """Выполняет функцию и записывает время её выполнения.
+
+    :param phases: Словарь {фаза: секунды}.
+    :param phase: Название фазы.
+    :param function: Функция без аргументов.
+    :return: Результат функции.
+    """
+    start = time.perf_counter()
+    result = function()
+    phases[phase] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def read_rows(file_name: str):
+    """Читает csv файл целиком модулем csv, как DataSet до отображения файла в память.
+
+    :param file_name: Имя файла.
+    :return: Tuple из списка заголовков и списка строк.
+    """
+    with open(file_name, encoding='utf-8-sig', newline='') as file:
+        reader = csv.reader(file)
+        return next(reader), list(reader)
+
+
+def benchmark_phases(file_name: str, prof_name: str, output_dir: str) -> Dict[str, float]:
+    """Замеряет по отдельности фазы обычного (объектного) режима DataSet и построение отчётов.
+
+    Для разделения фаз используются внутренние методы DataSet, поэтому каждая фаза
+    материализует свой результат в списке.
+
+    :param file_name: Имя csv файла.
+    :param prof_name: Название профессии.
+    :param output_dir: Папка для файлов отчётов.
+    :return: Словарь {фаза: секунды}.
+    """
+    phases = {}
+    headers, rows = timed(phases, 'csv_read', lambda: read_rows(file_name))
+    records = timed(phases, 'validation', lambda: list(RecordSchema(headers).records(rows)))
+    del rows
+    timed(phases, 'mapped_read', lambda: list(DataSet.read_records(file_name)))
+    vacancies = timed(phases, 'vacancy', lambda: [Vacancy.from_record(record) for record in records])
+    del records
+    data_set = timed(phases, 'grouping', lambda: DataSet.from_vacancies(vacancies, prof_name))
+    del vacancies
+    timed(phases, 'generate_excel',
+          lambda: ReportTable(data_set).generate_excel(os.path.join(output_dir, 'report.xlsx')))
+    timed(phases, 'generate_image',
+          lambda: ReportGraphic(data_set).generate_image(os.path.join(output_dir, 'graph.png')))
+    return phases
+
+
+def benchmark_modes(file_name: str, prof_name: str, processes: int, cache_dir: str) -> Dict[str, float]:
+    """Замеряет полное построение DataSet в разных режимах.
+
+    :param file_name: Имя csv файла.
+    :param prof_name: Название профессии.
+    :param processes: Количество процессов для параллельного режима.
+    :param cache_dir: Папка кэша колонок.
+    :return: Словарь {режим: секунды}.
+    """
+    modes = {}
+    timed(modes, 'default', lambda: DataSet(file_name, prof_name))
+    timed(modes, 'compact', lambda: DataSet(file_name, prof_name, compact=True))
+    timed(modes, 'streaming', lambda: DataSet(file_name, prof_name, streaming=True))
+    timed(modes, 'columnar', lambda: DataSet(file_name, prof_name, columnar=True))
+    timed(modes, 'cube', lambda: DataSet(file_name, prof_name, cube=True))
+    timed(modes, 'streaming_distributions', lambda: DataSet(file_name, prof_name, streaming=True, distributions=True))
+    if processes > 1:
+        timed(modes, 'parallel', lambda: DataSet(file_name, prof_name, processes=processes))
+    cache = ColumnsCache(cache_dir)
+    timed(modes, 'cache_cold', lambda: DataSet(file_name, prof_name, cache=cache))
+    timed(modes, 'cache_warm', lambda: DataSet(file_name, prof_name, cache=cache))
+    vacancy_file = os.path.join(os.path.dirname(cache_dir), 'vacancies.npz')
+    timed(modes, 'convert', lambda: VacancyFile.convert(file_name, vacancy_file))
+    timed(modes, 'vacancy_file', lambda: DataSet(vacancy_file, prof_name))
+    partitions = os.path.join(os.path.dirname(cache_dir), 'partitions')
+    timed(modes, 'split', lambda: YearPartitions.split(file_name, partitions))
+    timed(modes, 'partitions', lambda: DataSet(partitions, prof_name, streaming=True))
+    if processes > 1:
+        timed(modes, 'partitions_parallel', lambda: DataSet(partitions, prof_name, processes=processes))
+    return modes
+
+
+def benchmark_memory(file_name: str, count_rows: int) -> Dict[str, float]:
+    """Замеряет память на одну вакансию в списке для Vacancy и CompactVacancy.
+
+    Вакансии строятся прямо из потока записей, поэтому в замер входят и хранимые ими строки.
+
+    :param file_name: Имя csv файла.
+    :param count_rows: Количество строк для замера.
+    :return: Словарь {представление: байт на вакансию}.
+    """
+    memory = {}
+    for vacancy_type in (Vacancy, CompactVacancy):
+        records = itertools.islice(DataSet.read_records(file_name), count_rows)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        vacancies = [vacancy_type.from_record(record) for record in records]
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        memory[f'{vacancy_type.__name__}_bytes_per_row'] = round(used / max(len(vacancies), 1), 1)
+        del vacancies
+    return memory
+
+
+def benchmark_charts(file_name: str, count_renders: int, output_dir: str) -> Dict[str, float]:
+    """Сравнивает построение изображений по профессиям заново и на заготовке фигуры ChartTemplate.
+
+    :param file_name: Имя csv файла.
+    :param count_renders: Количество изображений в каждом варианте.
+    :param output_dir: Папка для изображений.
+    :return: Словарь {вариант: секунды} и ускорение.
+    """
+    data_set = DataSet(file_name, NAMES[0], streaming=True, professions=NAMES)
+    jobs = [(data_set.for_profession(NAMES[index % len(NAMES)]), os.path.join(output_dir, f'graph_{index}.png'))
+            for index in range(count_renders)]
+    charts = {}
+    timed(charts, 'fresh', lambda: [ReportGraphic(job).generate_image(name) for job, name in jobs])
+    template = ChartTemplate()
+    timed(charts, 'template', lambda: [template.render(job, name) for job, name in jobs])
+    template.close()
+    charts['speedup'] = round(charts['fresh'] / charts['template'], 2)
+    return charts
+
+
+def benchmark_startup(repeat: int = 5) -> Dict:
+    """Замеряет время импорта main через python -X importtime, каждый раз в новом процессе.
+
+    :param repeat: Количество запусков, берётся медиана.
+    :return: Словарь с медианой и всеми замерами в миллисекундах и списком тяжёлых модулей,
+        загруженных при импорте.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    heavy = set()
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=directory,
+                                   capture_output=True, text=True, check=True)
+        for line in completed.stderr.splitlines():
+            if not line.startswith('import time:') or line.endswith('imported package'):
+                continue
+            _, cumulative, module = line.split('|')
+            module = module.strip()
+            if module == 'main':
+                timings.append(int(cumulative) / 1000)
+            elif module.split('.')[0] in HEAVY_MODULES:
+                heavy.add(module.split('.')[0])
+    return {'import_ms': round(statistics.median(timings), 1), 'runs_ms': timings, 'heavy_modules': sorted(heavy)}
+
+
+def run(sizes: List[int], data_dir: str, prof_name: str, processes: int, skip_phases: bool,
+        chart_renders: int = 20) -> Dict:
+    """Генерирует выгрузки нужных размеров (если их ещё нет) и прогоняет на них бенчмарки.
+
+    :param sizes: Размеры выгрузок в строках.
+    :param data_dir: Папка для выгрузок.
+    :param prof_name: Название профессии.
+    :param processes: Количество процессов для параллельного режима.
+    :param skip_phases: Не замерять фазы по отдельности (они держат всю выгрузку в памяти).
+    :param chart_renders: Количество изображений для сравнения с заготовкой фигуры, замеряется на первой
+        выгрузке; при 0 не замеряется.
+    :return: Результаты в виде словаря для json.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+    for size in sizes:
+        file_name = os.path.join(data_dir, f'vacancies_{size}.csv')
+        generation = {}
+        if not os.path.exists(file_name):
+            timed(generation, 'generate', lambda: generate_vacancies(file_name, size))
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = {'rows': size, 'file_bytes': os.path.getsize(file_name), **generation,
+                      'modes': benchmark_modes(file_name, prof_name, processes, os.path.join(output_dir, 'cache'))}
+            if not skip_phases:
+                result['phases'] = benchmark_phases(file_name, prof_name, output_dir)
+            result['memory'] = benchmark_memory(file_name, min(size, 200_000))
+            if chart_renders and not results:
+                result['charts'] = benchmark_charts(file_name, chart_renders, output_dir)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+    return {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'machine': platform.machine(), 'cpu_count': os.cpu_count(),
+            'prof_name': prof_name, 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарки DataSet и отчётов на синтетических выгрузках.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000],
+                        help='размеры выгрузок в строках')
+    parser.add_argument('--data-dir', default='benchmark_data', help='папка для сгенерированных выгрузок')
+    parser.add_argument('--prof-name', default='Программист', help='название профессии')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='количество процессов для параллельного режима')
+    parser.add_argument('--skip-phases', action='store_true', help='не замерять фазы по отдельности')
+    parser.add_argument('--chart-renders', type=int, default=20,
+                        help='количество изображений для замера заготовки фигуры (0 - не замерять)')
+    parser.add_argument('--startup-only', action='store_true', help='замерить только время импорта main')
+    parser.add_argument('--max-import-ms', type=float,
+                        help='завершиться с ошибкой, если импорт main дольше (для проверки в CI)')
+    parser.add_argument('--output', default='benchmark.json', help='файл для результатов в формате json')
+    args = parser.parse_args()
+    startup = benchmark_startup()
+    print(json.dumps({'startup': startup}, ensure_ascii=False))
+    report = {} if args.startup_only else run(args.sizes, args.data_dir, args.prof_name, args.processes,
+                                              args.skip_phases, args.chart_renders)
+    report['startup'] = startup
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    if args.max_import_ms is not None and startup['import_ms'] > args.max_import_ms:
+        sys.exit(f"Импорт main занимает {startup['import_ms']} мс, допустимо {args.max_import_ms} мс")
@@ -1,43 +1,268 @@
+from __future__ import annotations
+
+import argparse
+import array
+import contextlib
+import copy
 import csv
+import hashlib
+import importlib
+import io
 import itertools
+import json
+import locale
+import logging
+import math
+import mmap
+import operator
+import os
+import pickle
 import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import Dict, Tuple, List, Callable, Iterable, Iterator, Set, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Модуль, который импортируется при первом обращении к его атрибутам.
+
+    numpy, matplotlib и openpyxl загружаются долго, а нужны не в каждом запуске: например, для EXCEL
+    отчёта не нужен matplotlib, а для потокового режима - numpy. После импорта атрибуты модуля копируются
+    в объект, поэтому дальнейшие обращения не медленнее обычных.
+    """
+
+    def __init__(self, name: str):
+        """Инициализирует отложенный модуль.
+
+        :param name: Полное имя модуля.
+        """
+        self.__name = name
+
+    def __getattr__(self, attr: str):
+        """Импортирует модуль и возвращает его атрибут.
+
+        :param attr: Имя атрибута.
+        :return: Атрибут модуля.
+        """
+        if attr.startswith('_LazyModule__'):
+            raise AttributeError(attr)
+        module = importlib.import_module(self.__name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+np = LazyModule('numpy')
+mpl_figure = LazyModule('matplotlib.figure')
+mpl_agg = LazyModule('matplotlib.backends.backend_agg')
+xl_workbook = LazyModule('openpyxl.workbook')
+xl_utils = LazyModule('openpyxl.utils')
+xl_cell = LazyModule('openpyxl.cell')
+xl_styles = LazyModule('openpyxl.styles')
+
+
+class Metrics:
+    """Сборщик метрик выполнения: время и память по стадиям, счётчики строк.
+
+    Для каждой стадии пишутся:
+    peak_rss_kb - пик памяти процесса за всё время работы к концу стадии;
+    rss_growth_kb - насколько стадия подняла этот пик, т.е. сколько памяти сверх прежнего пика ей понадобилось;
+    peak_traced_kb - пик памяти объектов Python, выделенной самой стадией (только при trace_memory).
+    Выключенный сборщик ничего не замеряет и не оборачивает итераторы, поэтому не замедляет работу.
+    """
+
+    def __init__(self, enabled: bool = True, log: bool = False, trace_memory: bool = False):
+        """Инициализирует объект Metrics.
+
+        :param enabled: Собирать ли метрики.
+        :param log: Писать ли каждую стадию в лог строкой json.
+        :param trace_memory: Замерять ли пик памяти стадий через tracemalloc. Точнее пика процесса,
+            но заметно замедляет выделение памяти и, значит, сами стадии.
+        """
+        self.enabled = enabled
+        self.log = log
+        self.trace_memory = enabled and trace_memory
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.__traced_peaks: List[int] = []
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Замеряет время и память блока кода. Время повторных замеров одной стадии суммируется,
+        для памяти берётся наибольшее значение.
+
+        :param name: Название стадии.
+        """
+        if not self.enabled:
+            yield
+            return
+        start_rss = self.__peak_rss_kb()
+        start_traced = self.__enter_traced()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            record = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            record['seconds'] = round(record['seconds'] + seconds, 6)
+            record['calls'] += 1
+            memory = {'peak_rss_kb': self.__peak_rss_kb()}
+            if start_rss is not None:
+                memory['rss_growth_kb'] = memory['peak_rss_kb'] - start_rss
+            if start_traced is not None:
+                memory['peak_traced_kb'] = (self.__exit_traced() - start_traced) // 1024
+            for key, value in memory.items():
+                record[key] = value if key not in record or value is None else max(record[key], value)
+            if self.log:
+                logger.info(json.dumps({'stage': name, 'seconds': round(seconds, 6), **memory}, ensure_ascii=False))
+
+    def __enter_traced(self) -> Optional[int]:
+        """Начинает замер пика tracemalloc для стадии.
+
+        Пик tracemalloc общий на процесс, поэтому перед сбросом он переносится во внешнюю стадию,
+        иначе вложенная стадия стёрла бы пик внешней.
+
+        :return: Объём памяти, отслеживаемой tracemalloc на начало стадии, None без trace_memory.
+        """
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        if self.__traced_peaks:
+            self.__traced_peaks[-1] = max(self.__traced_peaks[-1], peak)
+        tracemalloc.reset_peak()
+        self.__traced_peaks.append(current)
+        return current
+
+    def __exit_traced(self) -> int:
+        """Заканчивает замер пика tracemalloc для стадии и переносит его во внешнюю стадию.
+
+        :return: Пик памяти, отслеживаемой tracemalloc, за время стадии.
+        """
+        peak = max(tracemalloc.get_traced_memory()[1], self.__traced_peaks.pop())
+        if self.__traced_peaks:
+            self.__traced_peaks[-1] = max(self.__traced_peaks[-1], peak)
+        return peak
+
+    def count(self, name: str, value: int = 1):
+        """Увеличивает счётчик.
+
+        :param name: Название счётчика.
+        :param value: Приращение.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def counted(self, name: str, iterable: Iterable) -> Iterable:
+        """Оборачивает итератор так, чтобы каждый элемент увеличивал счётчик.
+
+        :param name: Название счётчика.
+        :param iterable: Итератор.
+        :return: Тот же поток элементов.
+        """
+        if not self.enabled:
+            return iterable
+        return self.__counted(name, iterable)
+
+    def __counted(self, name: str, iterable: Iterable) -> Iterator:
+        """Генератор для counted.
+
+        :param name: Название счётчика.
+        :param iterable: Итератор.
+        :return: Тот же поток элементов.
+        """
+        counters = self.counters
+        counters.setdefault(name, 0)
+        for item in iterable:
+            counters[name] += 1
+            yield item
+
+    def as_dict(self) -> Dict:
+        """Метрики в виде словаря для json.
+
+        :return: Словарь со стадиями и счётчиками.
+        """
+        return {'stages': self.stages, 'counters': self.counters}
+
+    @staticmethod
+    def __peak_rss_kb() -> Optional[int]:
+        """Пиковый размер памяти процесса в КБ, None там, где модуля resource нет.
 
-import numpy as np
-from matplotlib import pyplot as plt
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Border, Side
-from typing import Dict, Tuple, List, Callable
+        :return: Пик памяти процесса.
+        """
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
 
 
 class Vacancy:
 
-    def __init__(self, dict_vac: Dict[str, str]):
+    def __init__(self, dict_vac: Dict[str, str], rates: 'CurrencyRates' = None):
         """Инициализирует обхект Vacancy.
 
         :param dict_vac: Массиы сырых данных.
+        :param rates: Курсы валют по датам публикации, по умолчанию - фиксированные курсы currency_to_rub.
+        """
+        self.__fill(*(dict_vac[field] for field in RecordSchema.fields), rates)
+
+    @classmethod
+    def from_record(cls, record: Tuple[str, ...], rates: 'CurrencyRates' = None) -> 'Vacancy':
+        """Создаёт вакансию из записи RecordSchema без промежуточного словаря.
+
+        :param record: Значения столбцов в порядке RecordSchema.fields.
+        :param rates: Курсы валют по датам публикации, по умолчанию - фиксированные курсы currency_to_rub.
+        :return: Объект Vacancy.
+        """
+        vacancy = cls.__new__(cls)
+        vacancy.__fill(*record, rates)
+        return vacancy
+
+    def __fill(self, name: str, salary_from: str, salary_to: str, salary_currency: str, area_name: str,
+               published_at: str, rates: 'CurrencyRates'):
+        """Заполняет поля вакансии.
+
+        :param name: Название вакансии.
+        :param salary_from: Нижняя граница оклада.
+        :param salary_to: Верхняя граница оклада.
+        :param salary_currency: Валюта оклада.
+        :param area_name: Город.
+        :param published_at: Дата публикации.
+        :param rates: Курсы валют по датам публикации.
         """
-        self.name: str = dict_vac['name']
-        self.salary = self.get_medium_salary(dict_vac['salary_from'], dict_vac['salary_to'],
-                                             dict_vac['salary_currency'])
-        self.area_name = dict_vac['area_name']
-        self.year: int = int(dict_vac['published_at'][:4])
+        self.name: str = name
+        self.salary = self.get_medium_salary(salary_from, salary_to, salary_currency,
+                                             None if rates is None else rates.rate(salary_currency, published_at))
+        self.area_name = area_name
+        self.year: int = int(published_at[:4])
 
-    def get_medium_salary(self, salary_from: str, salary_to: str, salary_currency: str):
+    def get_medium_salary(self, salary_from: str, salary_to: str, salary_currency: str, rate: float = None):
         """Метод получения средней зарплаты в рублях
 
         :param salary_from: Нижняя граница оклада.
         :param salary_to: Верхняя граница оклада.
         :param salary_currency: Валюта оклада.
+        :param rate: Курс валюты к рублю, по умолчанию - из currency_to_rub.
         :return: Среднюю оклада.
         """
         salary_from = salary_from.split('.')[0]
         salary_to = salary_to.split('.')[0]
         raw_currency = salary_currency
         medium = (int(salary_from) + int(salary_to)) / 2
-        return medium * self.__currency_to_rub[raw_currency]
+        return medium * (self.currency_to_rub[raw_currency] if rate is None else rate)
 
-    __currency_to_rub: dict[str, float | int] = {
+    currency_to_rub: dict[str, float | int] = {
         "AZN": 35.68,
         "BYR": 23.91,
         "EUR": 59.90,
@@ -51,154 +276,2386 @@ class Vacancy:
     }
 
 
-class DataSet:
-    """Класс для обработки csv файлов
+class CompactVacancy:
+    """Компактная вакансия для обычного режима на больших выгрузках.
 
+    Поля те же, что у Vacancy, но хранятся в __slots__ без __dict__. Названия и города интернируются,
+    поэтому одинаковые строки хранятся один раз, а годы берутся из общего словаря целых чисел.
     """
-    def __init__(self, file_name: str, prof_name: str):
-        """Инициализирует объект DataSet
+    __slots__ = ('name', 'salary', 'area_name', 'year')
+    __years: Dict[str, int] = {}
 
-        :param file_name: Имя файла.
-        :param prof_name: Название профессии, по которой требуется более подробная информация.
+    def __init__(self, name: str, salary: float, area_name: str, year: int):
+        """Инициализирует объект CompactVacancy.
+
+        :param name: Название вакансии.
+        :param salary: Средняя ЗП в рублях.
+        :param area_name: Город.
+        :param year: Год публикации.
+        """
+        self.name = name
+        self.salary = salary
+        self.area_name = area_name
+        self.year = year
+
+    @classmethod
+    def from_record(cls, record: Tuple[str, ...], rates: 'CurrencyRates' = None) -> 'CompactVacancy':
+        """Создаёт вакансию из записи RecordSchema. ЗП считается так же, как в Vacancy.get_medium_salary.
+
+        :param record: Значения столбцов в порядке RecordSchema.fields.
+        :param rates: Курсы валют по датам публикации, по умолчанию - фиксированные курсы Vacancy.currency_to_rub.
+        :return: Объект CompactVacancy.
         """
-        list_raw_vacancies = self.__csv_filer(*self.__csv_reader(file_name))
-        self.__list_vacs = [Vacancy(vacancy) for vacancy in list_raw_vacancies]
+        name, salary_from, salary_to, salary_currency, area_name, published_at = record
+        rate = Vacancy.currency_to_rub[salary_currency] if rates is None else rates.rate(salary_currency,
+                                                                                          published_at)
+        year = cls.__years.get(published_at[:4])
+        if year is None:
+            year = cls.__years.setdefault(published_at[:4], int(published_at[:4]))
+        return cls(sys.intern(name), (int(salary_from.split('.')[0]) + int(salary_to.split('.')[0])) / 2 * rate,
+                   sys.intern(area_name), year)
+
+
+class RecordSchema:
+    """Схема записей выгрузки: столбцы, которые нужны Vacancy, и их номера в строке csv.
+
+    Строка принимается, если полей в ней столько же, сколько заголовков, и нужные столбцы не пусты.
+    Пустые значения в остальных столбцах допустимы. Отброшенные строки считаются по причинам:
+    field_count - неверное количество полей, empty_<столбец> - пустой нужный столбец.
+    """
+    fields = ('name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at')
 
-        grouped_by_year = self.group_by_year()
-        grouped_by_name = self.group_by_year_with_name(prof_name)
-        self.prof_name = prof_name
-        self.years = list(grouped_by_year.keys())
-        self.salary_by_year_dict = self.salary_by_years(grouped_by_year)
-        self.count_by_year_dict = self.count_by_years(grouped_by_year)
-        self.salary_by_year_name_dict = self.salary_by_years(grouped_by_name)
-        self.count_by_year_name_dict = self.count_by_years(grouped_by_name)
-        grouped_by_city, dola_group = self.group_by_city()
-        count_first_cities = 10
-        self.salary_by_city_dict = dict(
-            itertools.islice(self.salary_by_city(grouped_by_city).items(), count_first_cities))
-        self.percent_by_city_dict = dict(itertools.islice(dola_group.items(), count_first_cities))
-        self.cities_by_salary = list(self.salary_by_city_dict.keys())
-        self.cities_by_percent = list(self.percent_by_city_dict.keys())
+    def __init__(self, headers: List[str]):
+        """Находит нужные столбцы в заголовках.
+
+        :param headers: Массив заголовков.
+        """
+        missing = [field for field in self.fields if field not in headers]
+        if missing:
+            raise Exception(f"В файле нет столбцов: {', '.join(missing)}")
+        self.indices = [headers.index(field) for field in self.fields]
+        self.width = len(headers)
+        self.accepted = 0
+        self.rejects: Dict[str, int] = {}
+
+    def records(self, rows: Iterable[List[str]]) -> Iterator[Tuple[str, ...]]:
+        """Проверяет строки и выбирает из них нужные столбцы.
+
+        Счётчики accepted и rejects обновляются по ходу чтения.
+
+        :param rows: Итератор по строкам csv.
+        :return: Итератор по записям - значениям столбцов в порядке fields.
+        """
+        project = operator.itemgetter(*self.indices)
+        width = self.width
+        rejects = self.rejects
+        accepted = 0
+        try:
+            for row in rows:
+                if len(row) != width:
+                    reason = 'field_count'
+                else:
+                    record = project(row)
+                    if '' not in record:
+                        accepted += 1
+                        yield record
+                        continue
+                    reason = 'empty_' + self.fields[record.index('')]
+                rejects[reason] = rejects.get(reason, 0) + 1
+        finally:
+            self.accepted += accepted
+
+
+class MappedCsvReader:
+    """Чтение нужных столбцов csv файла через mmap без декодирования остальных полей.
+
+    Файл отображается в память и разбирается блоками регулярным выражением прямо по байтам. Поля ненужных
+    столбцов (например, описание вакансии) пропускаются без декодирования и создания строк, нужные столбцы
+    блока склеиваются, освобождаются от кавычек и декодируются одной операцией на столбец. От published_at
+    берётся только начало 'ГГГГ-ММ' (см. prefixes): год нужен Vacancy, месяц - курсам по периодам.
+    Записи, не подходящие под быстрый разбор (другое количество полей, кавычки внутри поля без кавычек
+    и т.п.), разбираются модулем csv по одной. Проверка и счётчики отброшенных строк - как у RecordSchema.
+
+    Если в начале файла (sample_size байт) на ненужные столбцы приходится меньше min_skipped_share байт,
+    пропускать нечего, и блоки того же отображения разбираются модулем csv, который на узких выгрузках
+    быстрее выражения; published_at тогда остаётся полным.
+    """
+    block_size = 1 << 22
+    sample_size = 1 << 16
+    min_skipped_share = 0.5
+    prefixes = {'published_at': 7}
+    __field = rb'("[^"]*(?:""[^"]*)*"|[^,"\r\n]*)'
+    __skipped = rb'(?:"[^"]*(?:""[^"]*)*"|[^,"\r\n]*)'
+    __any_field = rb'(?:"[^"]*(?:""[^"]*)*(?:"[^,\r\n]*|\Z)|[^,"\r\n][^,\r\n]*|)'
+    __other = rb'(' + __any_field + rb'(?:,' + __any_field + rb')*)(\r\n|\n|\r|\Z)'
+    __quoted = re.compile(rb'"[^"]*(?:""[^"]*)*(?:"|\Z)')
+    __line_end = re.compile(rb'\r\n|\n|\r')
+    __separator = '\x00'
+
+    def __init__(self, file_name: str, encoding: str = None):
+        """Читает заголовки файла. Строка заголовков кончается, как любая запись, в том числе одиночным CR.
+
+        :param file_name: Имя csv файла.
+        :param encoding: Кодировка файла, по умолчанию - кодировка системы, как у open.
+        """
+        self.file_name = file_name
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        header_line = b''
+        with open(file_name, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    header_line = buffer[:self.record_ends(buffer, 0, size, [0])[0]]
+        self.start = len(header_line)
+        self.headers = next(csv.reader(io.StringIO(header_line.decode(self.encoding), newline='')), [])
+
+    def records(self, schema: RecordSchema, bounds: Tuple[int, int] = None) -> Iterator[Tuple[str, ...]]:
+        """Потоково читает и проверяет записи файла.
+
+        :param schema: Схема, построенная по self.headers. Её счётчики обновляются по мере разбора блоков.
+        :param bounds: Диапазон байт (начало, конец), выровненный по границам записей, по умолчанию - все
+            записи после заголовков.
+        :return: Итератор по записям в порядке RecordSchema.fields.
+        """
+        return itertools.chain.from_iterable(self.__parse(schema, *(bounds or (self.start, None))))
+
+    def __parse(self, schema: RecordSchema, start: int, end: Optional[int]) -> Iterator[Iterable[Tuple[str, ...]]]:
+        """Разбирает записи диапазона файла блоками. Файл отображён в память, пока перебираются блоки.
+
+        :param schema: Схема записей.
+        :param start: Начало диапазона.
+        :param end: Конец диапазона, None - конец файла.
+        :return: Итератор по блокам, каждый блок - итератор по принятым записям.
+        """
+        pattern, layout = self.__pattern(schema)
+        with open(self.file_name, 'rb') as file:
+            if os.fstat(file.fileno()).st_size <= start:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                end = len(buffer) if end is None else end
+                sample_start, sample_end = next(self.__blocks(buffer, start, end, self.sample_size))
+                captured = sum(map(len, itertools.chain.from_iterable(
+                    pattern.findall(buffer, sample_start, sample_end))))
+                scan = 1 - captured / (sample_end - sample_start) >= self.min_skipped_share
+                for block_start, block_end in self.__blocks(buffer, start, end, self.block_size):
+                    if not scan:
+                        yield schema.records(csv.reader(io.StringIO(
+                            buffer[block_start:block_end].decode(self.encoding), newline='')))
+                        continue
+                    rows = pattern.findall(buffer, block_start, block_end)
+                    if not rows:
+                        continue
+                    columns = list(zip(*rows))
+                    fields = None if any(columns[-1]) else self.__decode_columns(columns, layout)
+                    if fields is None:
+                        records = list(self.__parse_rows(rows, schema, layout))
+                        schema.accepted += len(records)
+                        yield records
+                        continue
+                    valid = list(map(all, zip(*fields)))
+                    for record in itertools.compress(zip(*fields), map(operator.not_, valid)):
+                        reason = 'empty_' + schema.fields[record.index('')]
+                        schema.rejects[reason] = schema.rejects.get(reason, 0) + 1
+                    schema.accepted += valid.count(True)
+                    yield itertools.compress(zip(*fields), valid)
+
+    def __pattern(self, schema: RecordSchema) -> Tuple[re.Pattern, List[int]]:
+        """Строит регулярное выражение записи: нужные столбцы захватываются, остальные пропускаются.
+
+        Запись с другим количеством полей или нестандартными кавычками совпадает с последней альтернативой,
+        которая захватывает запись целиком, поэтому совпадения идут подряд без пропусков.
+
+        :param schema: Схема записей.
+        :return: Tuple из выражения и номеров групп полей в порядке RecordSchema.fields.
+        """
+        fields_by_column = {column: field for field, column in zip(schema.fields, schema.indices)}
+        parts = []
+        groups = {}
+        for column in range(schema.width):
+            field = fields_by_column.get(column)
+            if field is None:
+                parts.append(self.__skipped)
+                continue
+            groups[field] = len(groups)
+            if field in self.prefixes:
+                parts.append(rb'([^,"\r\n]{0,%d})[^,"\r\n]*' % self.prefixes[field])
+            else:
+                parts.append(self.__field)
+        record = b','.join(parts) + rb'(?:\r\n|\n|\r|\Z)'
+        return (re.compile(rb'(?=[\s\S])(?:' + record + rb'|' + self.__other + rb')'),
+                [groups[field] for field in schema.fields])
+
+    @classmethod
+    def record_ends(cls, buffer: bytes, start: int, end: int, targets: Iterable[int]) -> List[int]:
+        """Находит концы записей не раньше заданных позиций.
+
+        Состояние разбора отслеживается от начала диапазона так же, как у модуля csv: кавычка открывает
+        поле в кавычках только в начале поля (после разделителя или конца строки), в поле без кавычек
+        она - обычный символ. Конец строки внутри поля в кавычках концом записи не считается.
+
+        :param buffer: Байты или отображение файла.
+        :param start: Начало диапазона - начало записи.
+        :param end: Конец диапазона.
+        :param targets: Позиции по возрастанию.
+        :return: Для каждой позиции - конец первой записи, которая заканчивается не раньше неё, или end.
+        """
+        quoted = cls.__quoted_fields(buffer, start, end)
+        field = next(quoted, None)
+        cuts = []
+        for target in targets:
+            position = max(target, cuts[-1] if cuts else start)
+            while True:
+                while field is not None and field[1] <= position:
+                    field = next(quoted, None)
+                if field is not None and field[0] < position:
+                    position = field[1]
+                    continue
+                line_end = cls.__line_end.search(buffer, position, end)
+                if line_end is None:
+                    position = end
+                elif field is not None and field[0] < line_end.start():
+                    position = field[1]
+                    continue
+                else:
+                    position = line_end.end()
+                break
+            cuts.append(position)
+        return cuts
+
+    @classmethod
+    def __quoted_fields(cls, buffer: bytes, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """Перебирает поля в кавычках диапазона.
+
+        Кавычка не в начале поля - обычный символ поля без кавычек: поиск продолжается со следующего байта.
+
+        :param buffer: Байты или отображение файла.
+        :param start: Начало диапазона - начало записи.
+        :param end: Конец диапазона.
+        :return: Итератор по полям (начало, конец), незакрытое поле продолжается до end.
+        """
+        position = start
+        while True:
+            for field in cls.__quoted.finditer(buffer, position, end):
+                if field.start() == start or buffer[field.start() - 1] in b',\r\n':
+                    yield field.span()
+                else:
+                    position = field.start() + 1
+                    break
+            else:
+                return
+
+    @classmethod
+    def __blocks(cls, buffer: mmap.mmap, start: int, end: int, block_size: int) -> Iterator[Tuple[int, int]]:
+        """Делит диапазон на блоки около block_size, границы которых совпадают с границами записей.
+
+        :param buffer: Отображение файла.
+        :param start: Начало диапазона.
+        :param end: Конец диапазона.
+        :param block_size: Размер блока в байтах.
+        :return: Итератор по блокам (начало, конец).
+        """
+        while start < end:
+            stop = cls.record_ends(buffer, start, end, [min(end, start + block_size)])[0]
+            yield start, stop
+            start = stop
+
+    def __decode_columns(self, columns: List[Tuple[bytes, ...]], layout: List[int]) -> Optional[List[List[str]]]:
+        """Декодирует нужные столбцы блока, по одной операции на столбец.
+
+        Значения склеиваются через разделитель. Кавычки бывают только у значений в кавычках, поэтому
+        внешние кавычки - это кавычки рядом с разделителем, а удвоенные внутри заменяются одинарными.
+
+        :param columns: Группы совпадений блока по столбцам.
+        :param layout: Номера групп полей.
+        :return: Массив столбцов строк в порядке RecordSchema.fields или None, если в значениях встретился
+            разделитель и блок нужно разобрать по записям.
+        """
+        separator = self.__separator.encode()
+        fields = []
+        for group in layout:
+            joined = separator + separator.join(columns[group]) + separator
+            if b'"' in joined:
+                joined = (joined.replace(separator + b'"', separator).replace(b'"' + separator, separator)
+                          .replace(b'""', b'"'))
+            field = joined.decode(self.encoding).split(self.__separator)
+            if len(field) != len(columns[group]) + 2:
+                return None
+            fields.append(field[1:-1])
+        return fields
+
+    def __parse_rows(self, rows: Iterable[Tuple[bytes, ...]], schema: RecordSchema,
+                     layout: List[int]) -> Iterator[Tuple[str, ...]]:
+        """Разбирает блок по записям: нестандартные записи - модулем csv, как при обычном чтении.
+
+        :param rows: Группы совпадений по записям.
+        :param schema: Схема записей.
+        :param layout: Номера групп полей.
+        :return: Итератор по принятым записям, отброшенные считаются в schema.rejects.
+        """
+        project = operator.itemgetter(*schema.indices)
+        prefixes = [self.prefixes.get(field) for field in schema.fields]
+        for row in rows:
+            if row[-1] or row[-2]:
+                parsed = list(csv.reader(io.StringIO(row[-2].decode(self.encoding), newline=''))) or [[]]
+                records = [tuple(value[:prefix] for value, prefix in zip(project(fields), prefixes))
+                           if len(fields) == schema.width else None for fields in parsed]
+            else:
+                records = [tuple((row[group][1:-1].replace(b'""', b'"') if row[group][:1] == b'"' else row[group])
+                                 .decode(self.encoding) for group in layout)]
+            for record in records:
+                if record is None:
+                    reason = 'field_count'
+                elif '' not in record:
+                    yield record
+                    continue
+                else:
+                    reason = 'empty_' + schema.fields[record.index('')]
+                schema.rejects[reason] = schema.rejects.get(reason, 0) + 1
+
+
+class CurrencyRates:
+    """Таблица курсов валют к рублю для пакетного пересчёта ЗП.
+
+    Помимо фиксированных курсов может содержать курсы по годам ('2010') или месяцам ('2010-05'),
+    которые сопоставляются с датой публикации вакансии. Если курса за месяц нет, берётся курс за год,
+    если нет и его - фиксированный.
+    """
 
-    def __csv_reader(self, file_name: str) -> Tuple[List, List]:
-        """Читает csv файл.
+    def __init__(self, fixed: Dict[str, float] = None, periodic: Dict[str, Dict[str, float]] = None):
+        """Инициализирует объект CurrencyRates.
+
+        :param fixed: Фиксированные курсы {валюта: курс}, по умолчанию - Vacancy.currency_to_rub.
+        :param periodic: Курсы по периодам {'ГГГГ' или 'ГГГГ-ММ': {валюта: курс}}.
+        """
+        self.fixed = dict(Vacancy.currency_to_rub if fixed is None else fixed)
+        self.periodic = periodic or {}
+
+    @classmethod
+    def load(cls, file_name: str, fixed: Dict[str, float] = None) -> 'CurrencyRates':
+        """Загружает курсы по периодам из csv файла.
+
+        Первый столбец - период (ГГГГ или ГГГГ-ММ), остальные - коды валют. Пустая ячейка означает,
+        что курса за период нет.
 
         :param file_name: Имя файла.
-        :return: Tuple из списка заголовков и данных.
+        :param fixed: Фиксированные курсы для валют и периодов, которых нет в файле.
+        :return: Таблица курсов.
         """
+        periodic = {}
         with open(file_name, newline='') as csvfile:
             reader = csv.reader(csvfile, delimiter=',')
-            data = [line for line in reader]
-            return data[0], data[1:]
+            headers = next(reader)
+            for row in reader:
+                periodic[row[0][:7]] = {currency: float(rate) for currency, rate in zip(headers[1:], row[1:]) if rate}
+        return cls(fixed, periodic)
 
-    def __csv_filer(self, headers: List[str], data: List[str]) -> List[Dict[str, str]]:
-        """Преобразует массив сырых данных в массив словарей.
+    def rate(self, currency: str, published_at: str) -> float:
+        """Курс валюты на дату публикации.
 
-        :param headers: Массив заголовков.
-        :param data: Массив сырых данных.
-        :return: Массив словарей, где ключ - название столбца.
+        :param currency: Код валюты.
+        :param published_at: Дата публикации в формате ISO.
+        :return: Курс к рублю.
+        """
+        for period in (published_at[:7], published_at[:4]):
+            rate = self.periodic.get(period, {}).get(currency)
+            if rate is not None:
+                return rate
+        return self.fixed[currency]
+
+    def rates_for(self, currencies: List[str], currency: np.ndarray, year: np.ndarray,
+                  month: np.ndarray) -> np.ndarray:
+        """Векторно подбирает курсы для массива вакансий.
+
+        :param currencies: Коды валют по индексам.
+        :param currency: Индексы валют вакансий.
+        :param year: Годы публикации.
+        :param month: Месяцы публикации.
+        :return: Массив курсов к рублю.
         """
-        array = []
-        for vacancy in data:
-            categories = [category for category in vacancy if len(category) != 0]
-            if len(categories) != len(headers):
+        rates = np.array([self.fixed.get(code, np.nan) for code in currencies], dtype=np.float64)[currency]
+        year = year.astype(np.int64)
+        for length, key in ((4, year), (7, year * 12 + month - 1)):
+            table, first = self.__period_table(length, currencies)
+            if table is None:
                 continue
-            array.append(dict(zip(headers, categories)))
-        return array
+            inside = (key >= first) & (key < first + len(table))
+            found = np.full(len(rates), np.nan)
+            found[inside] = table[key[inside] - first, currency[inside]]
+            rates = np.where(np.isnan(found), rates, found)
+        if np.isnan(rates).any():
+            raise KeyError(currencies[currency[np.isnan(rates)][0]])
+        return rates
+
+    def __period_table(self, length: int, currencies: List[str]) -> Tuple[np.ndarray, int]:
+        """Строит плотную таблицу курсов по годам или месяцам.
+
+        :param length: Длина ключа периода: 4 - годы, 7 - месяцы.
+        :param currencies: Коды валют по индексам.
+        :return: Таблица [период, валюта] с NaN там, где курса нет, и номер первого периода.
+            Если периодов такой длины нет - (None, 0).
+        """
+        keys = {int(period[:4]) if length == 4 else int(period[:4]) * 12 + int(period[5:7]) - 1: values
+                for period, values in self.periodic.items() if len(period) == length}
+        if not keys:
+            return None, 0
+        first = min(keys)
+        table = np.full((max(keys) - first + 1, len(currencies)), np.nan)
+        for key, values in keys.items():
+            for index, code in enumerate(currencies):
+                if code in values:
+                    table[key - first, index] = values[code]
+        return table, first
+
+    def fingerprint(self) -> str:
+        """Хэш таблицы курсов, чтобы кэш колонок различал разные курсы.
+
+        :return: Шестнадцатеричная строка.
+        """
+        return hashlib.blake2b(json.dumps([self.fixed, self.periodic], sort_keys=True).encode(),
+                               digest_size=16).hexdigest()
+
+
+class AhoCorasick:
+    """Поиск сразу нескольких подстрок за один проход по тексту (алгоритм Ахо-Корасик).
+
+    Время поиска зависит от длины текста и числа найденных подстрок, но не от количества образцов.
+    """
+
+    def __init__(self, patterns: List[str]):
+        """Строит автомат по образцам.
+
+        :param patterns: Массив искомых подстрок.
+        """
+        self.__goto: List[Dict[str, int]] = [{}]
+        self.__fail: List[int] = [0]
+        self.__out: List[Tuple[int, ...]] = [()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.__goto[state]:
+                    self.__goto.append({})
+                    self.__fail.append(0)
+                    self.__out.append(())
+                    self.__goto[state][char] = len(self.__goto) - 1
+                state = self.__goto[state][char]
+            self.__out[state] += (index,)
+
+        queue = list(self.__goto[0].values())
+        for state in queue:
+            self.__out[state] += self.__out[0]
+        for state in queue:
+            for char, child in self.__goto[state].items():
+                fail = self.__fail[state]
+                while fail and char not in self.__goto[fail]:
+                    fail = self.__fail[fail]
+                self.__fail[child] = self.__goto[fail].get(char, 0)
+                self.__out[child] += self.__out[self.__fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> Set[int]:
+        """Ищет образцы в тексте.
+
+        :param text: Текст.
+        :return: Множество индексов образцов, встретившихся в тексте.
+        """
+        goto, fail, out = self.__goto, self.__fail, self.__out
+        found = set(out[0])
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class SalaryDistribution:
+    """Сжатое распределение ЗП: логарифмический скетч квантилей и гистограмма с корзинами фиксированной ширины.
+
+    Скетч хранит количества ЗП по корзинам (gamma^(i-1), gamma^i], как DDSketch, поэтому любой квантиль
+    возвращается с относительной погрешностью не больше relative_accuracy, а память зависит от разброса ЗП,
+    но не от количества вакансий. Распределения частей файла складываются через merge без потери точности.
+    """
+    relative_accuracy = 0.01
+    bin_width = 10000
+    __gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    __log_gamma = math.log(__gamma)
+
+    def __init__(self):
+        """Инициализирует пустое распределение.
+
+        """
+        self.count = 0
+        self.zeros = 0
+        self.buckets: Dict[int, int] = {}
+        self.bins: Dict[int, int] = {}
+
+    def add(self, salary: float, count: int = 1) -> 'SalaryDistribution':
+        """Добавляет ЗП.
+
+        :param salary: ЗП в рублях.
+        :param count: Количество вакансий с такой ЗП.
+        :return: Это же распределение.
+        """
+        self.count += count
+        if salary <= 0:
+            self.zeros += count
+            self.bins[0] = self.bins.get(0, 0) + count
+            return self
+        index = math.ceil(math.log(salary) / self.__log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        index = int(salary // self.bin_width)
+        self.bins[index] = self.bins.get(index, 0) + count
+        return self
+
+    def add_array(self, salaries: np.ndarray) -> 'SalaryDistribution':
+        """Добавляет массив ЗП векторно.
+
+        :param salaries: Массив ЗП в рублях.
+        :return: Это же распределение.
+        """
+        positive = salaries[salaries > 0]
+        self.count += len(salaries)
+        self.zeros += len(salaries) - len(positive)
+        indices, counts = np.unique(np.ceil(np.log(positive) / self.__log_gamma).astype(np.int64),
+                                    return_counts=True)
+        self.__merge_counts(self.buckets, zip(indices.tolist(), counts.tolist()))
+        indices, counts = np.unique((np.maximum(salaries, 0) // self.bin_width).astype(np.int64),
+                                    return_counts=True)
+        self.__merge_counts(self.bins, zip(indices.tolist(), counts.tolist()))
+        return self
+
+    def merge(self, other: 'SalaryDistribution') -> 'SalaryDistribution':
+        """Добавляет другое распределение, например по другой части файла.
+
+        :param other: Распределение.
+        :return: Это же распределение.
+        """
+        self.count += other.count
+        self.zeros += other.zeros
+        self.__merge_counts(self.buckets, other.buckets.items())
+        self.__merge_counts(self.bins, other.bins.items())
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Оценивает квантиль ЗП.
+
+        :param q: Уровень от 0 до 1, например 0.5 для медианы.
+        :return: ЗП с относительной погрешностью не больше relative_accuracy, для пустого распределения - 0.
+        """
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen or not self.buckets:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                break
+        return 2 * self.__gamma ** index / (self.__gamma + 1)
+
+    def histogram(self, count_bins: int = None) -> List[int]:
+        """Количества вакансий по корзинам ЗП [i * bin_width, (i + 1) * bin_width).
+
+        :param count_bins: Количество корзин, последняя включает все большие ЗП. По умолчанию - до последней
+            непустой корзины.
+        :return: Массив количеств по корзинам.
+        """
+        if count_bins is None:
+            count_bins = max(self.bins, default=-1) + 1
+        histogram = [0] * count_bins
+        for index, count in self.bins.items():
+            histogram[min(index, count_bins - 1)] += count
+        return histogram
 
     @staticmethod
-    def clean_text(text: str) -> str:
-        """Очищает текст от лишних символов.
+    def __merge_counts(target: Dict[int, int], counts: Iterable[Tuple[int, int]]):
+        """Добавляет количества по корзинам.
 
-        :param text: Сырой текст.
-        :return: Чистый текст.
+        :param target: Словарь {корзина: количество}.
+        :param counts: Пары (корзина, количество).
         """
-        cleaned_text = re.sub(re.compile('<.*?>'), '', text).strip()
-        return ';'.join(cleaned_text.split('\n')) if '\n' in cleaned_text else ' '.join(cleaned_text.split())
+        for index, count in counts:
+            target[index] = target.get(index, 0) + count
+
 
-    def group_by_year(self) -> Dict[int, List[Vacancy]]:
-        """Группирует массивы вакансий по годам.
+class VacancyColumns:
+    """Колоночное хранилище вакансий на массивах NumPy.
 
-        :return: Словарь {год: массив вакнсий}.
+    Города и названия вакансий хранятся как целочисленные коды в порядке первого появления в файле,
+    сами строки лежат в списках areas и names.
+    """
+
+    def __init__(self, salary: np.ndarray, year: np.ndarray, area: np.ndarray, name: np.ndarray,
+                 areas: List[str], names: List[str]):
+        """Инициализирует объект VacancyColumns.
+
+        :param salary: Средние ЗП в рублях (float64).
+        :param year: Годы публикации (int16).
+        :param area: Коды городов (int32).
+        :param name: Коды названий вакансий (int32).
+        :param areas: Названия городов по кодам.
+        :param names: Названия вакансий по кодам.
         """
-        dict_years = {}
-        for vacancy in self.__list_vacs:
-            if not dict_years.keys().__contains__(vacancy.year):
-                dict_years[vacancy.year] = [vacancy]
-            else:
-                dict_years[vacancy.year].append(vacancy)
-        return dict_years
+        self.salary = salary
+        self.year = year
+        self.area = area
+        self.name = name
+        self.areas = areas
+        self.names = names
+
+    @classmethod
+    def from_vacancies(cls, vacancies: Iterable[Vacancy]) -> 'VacancyColumns':
+        """Собирает колонки из потока вакансий за один проход.
+
+        :param vacancies: Итератор по вакансиям.
+        :return: Колоночное хранилище.
+        """
+        salary, year, area, name = array.array('d'), array.array('h'), array.array('i'), array.array('i')
+        area_codes: Dict[str, int] = {}
+        name_codes: Dict[str, int] = {}
+        for vacancy in vacancies:
+            salary.append(vacancy.salary)
+            year.append(vacancy.year)
+            area.append(area_codes.setdefault(vacancy.area_name, len(area_codes)))
+            name.append(name_codes.setdefault(vacancy.name, len(name_codes)))
+        return cls(np.frombuffer(salary, dtype=np.float64), np.frombuffer(year, dtype=np.int16),
+                   np.frombuffer(area, dtype=np.int32), np.frombuffer(name, dtype=np.int32),
+                   list(area_codes), list(name_codes))
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, ...]], rates: CurrencyRates,
+                     batch_size: int = 1 << 18) -> 'VacancyColumns':
+        """Собирает колонки из потока записей RecordSchema, пересчитывая ЗП пакетами.
+
+        Строки складываются в пакеты по batch_size, внутри пакета оклады разбираются и переводятся
+        в рубли сразу для всего столбца через массив курсов, без объектов Vacancy.
+
+        :param records: Итератор по записям в порядке RecordSchema.fields.
+        :param rates: Таблица курсов валют.
+        :param batch_size: Размер пакета.
+        :return: Колоночное хранилище.
+        """
+        salary, year, area, name = [], [], [], []
+        area_codes: Dict[str, int] = {}
+        name_codes: Dict[str, int] = {}
+        currency_codes: Dict[str, int] = {}
+        records = iter(records)
+        for batch in iter(lambda: list(itertools.islice(records, batch_size)), []):
+            names, salary_from, salary_to, currencies, areas, published = zip(*batch)
+            count = len(batch)
+            years = np.fromiter((int(date[:4]) for date in published), dtype=np.int16, count=count)
+            months = np.fromiter((int(date[5:7]) for date in published), dtype=np.int64, count=count) \
+                if rates.periodic else np.ones(count, dtype=np.int64)
+            currency = cls.__encode(currencies, currency_codes)
+            medium = (np.trunc(np.fromiter(map(float, salary_from), dtype=np.float64, count=count))
+                      + np.trunc(np.fromiter(map(float, salary_to), dtype=np.float64, count=count))) / 2
+            salary.append(medium * rates.rates_for(list(currency_codes), currency, years, months))
+            year.append(years)
+            area.append(cls.__encode(areas, area_codes))
+            name.append(cls.__encode(names, name_codes))
+        if not salary:
+            return cls(np.zeros(0), np.zeros(0, dtype=np.int16), np.zeros(0, dtype=np.int32),
+                       np.zeros(0, dtype=np.int32), [], [])
+        return cls(np.concatenate(salary), np.concatenate(year), np.concatenate(area), np.concatenate(name),
+                   list(area_codes), list(name_codes))
+
+    @staticmethod
+    def __encode(values: Tuple[str, ...], codes: Dict[str, int]) -> np.ndarray:
+        """Кодирует пакет строк целыми числами, новые строки получают коды в порядке первого появления.
+
+        :param values: Строки пакета.
+        :param codes: Общий словарь {строка: код}, дополняется новыми строками.
+        :return: Массив кодов int32.
+        """
+        add = codes.setdefault
+        return np.fromiter([add(value, len(codes)) for value in values], dtype=np.int32, count=len(values))
+
+    def __len__(self) -> int:
+        return len(self.salary)
+
+    def name_mask(self, prof_name: str) -> np.ndarray:
+        """Маска вакансий, в названии которых есть название профессии.
+
+        Подстрока ищется только среди уникальных названий, а не по каждой вакансии.
+
+        :param prof_name: Название профессии.
+        :return: Булев массив длиной в число вакансий.
+        """
+        matched = np.fromiter((prof_name in name for name in self.names), dtype=bool, count=len(self.names))
+        return matched[self.name]
+
+    def group_by_year(self, mask: np.ndarray = None) -> Dict[int, Tuple[float, int]]:
+        """Считает сумму и количество ЗП по годам.
+
+        :param mask: Маска или отсортированные номера отбираемых вакансий, по умолчанию - все.
+        :return: Словарь {год: (сумма ЗП, количество)} в порядке первого появления года.
+        """
+        year, salary = (self.year, self.salary) if mask is None else (self.year[mask], self.salary[mask])
+        years, first, inverse = np.unique(year, return_index=True, return_inverse=True)
+        sums = np.bincount(inverse, weights=salary, minlength=len(years))
+        counts = np.bincount(inverse, minlength=len(years))
+        return {int(years[i]): (float(sums[i]), int(counts[i])) for i in np.argsort(first)}
+
+    def group_by_city(self, mask: np.ndarray = None) -> Dict[str, Tuple[float, int]]:
+        """Считает сумму и количество ЗП по городам.
+
+        :param mask: Маска или номера отбираемых вакансий, по умолчанию - все.
+        :return: Словарь {город: (сумма ЗП, количество)} в порядке первого появления города.
+        """
+        area, salary = (self.area, self.salary) if mask is None else (self.area[mask], self.salary[mask])
+        sums = np.bincount(area, weights=salary, minlength=len(self.areas)).tolist()
+        counts = np.bincount(area, minlength=len(self.areas)).tolist()
+        return {city: (sums[code], counts[code]) for code, city in enumerate(self.areas) if counts[code]}
+
+    def distributions(self, by: str, mask: np.ndarray = None) -> Dict:
+        """Строит распределения ЗП по годам или по городам.
+
+        :param by: 'year' - по годам, 'city' - по городам.
+        :param mask: Маска или номера отбираемых вакансий, по умолчанию - все.
+        :return: Словарь {год или город: SalaryDistribution}.
+        """
+        codes = self.year if by == 'year' else self.area
+        salary = self.salary
+        if mask is not None:
+            codes, salary = codes[mask], salary[mask]
+        order = np.argsort(codes, kind='stable')
+        codes, salary = codes[order], salary[order]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        labels = codes[np.concatenate(([0], bounds))].tolist() if len(codes) else []
+        return {label if by == 'year' else self.areas[label]: SalaryDistribution().add_array(part)
+                for label, part in zip(labels, np.split(salary, bounds))}
+
+    def group_by_year_city_name(self, batch_size: int = 1 << 16) -> Iterator[Tuple[int, str, str, float, int]]:
+        """Считает сумму и количество ЗП для каждой тройки (год, город, название вакансии).
+
+        Тройки сворачиваются векторно, а в объекты Python превращаются пачками, поэтому память
+        ограничена количеством различных троек, а не строк.
+
+        :param batch_size: Количество троек в одной пачке.
+        :return: Итератор по кортежам (год, город, название, сумма ЗП, количество), упорядоченным
+            по году, затем по порядку первого появления города и названия.
+        """
+        if not len(self):
+            return
+        years, year_index = np.unique(self.year, return_inverse=True)
+        width = len(self.areas) * len(self.names)
+        keys, inverse = np.unique(year_index.astype(np.int64) * width + self.area.astype(np.int64) * len(self.names)
+                                  + self.name, return_inverse=True)
+        sums = np.bincount(inverse, weights=self.salary, minlength=len(keys))
+        counts = np.bincount(inverse, minlength=len(keys))
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            cities = map(self.areas.__getitem__, (batch % width // len(self.names)).tolist())
+            names = map(self.names.__getitem__, (batch % len(self.names)).tolist())
+            yield from zip(years[batch // width].tolist(), cities, names,
+                           sums[start:start + batch_size].tolist(), counts[start:start + batch_size].tolist())
+
+    def group_by_year_professions(self, matcher: AhoCorasick, count_professions: int
+                                  ) -> List[Dict[int, Tuple[float, int]]]:
+        """Считает сумму и количество ЗП по годам сразу для многих профессий.
+
+        Строки сначала сворачиваются в пары (год, название), затем каждая пара добавляется ко всем
+        профессиям, найденным в названии. Поиск профессий выполняется один раз на уникальное название.
+
+        :param matcher: Автомат поиска названий профессий.
+        :param count_professions: Количество профессий в автомате.
+        :return: Массив словарей {год: (сумма ЗП, количество)}, по одному на профессию.
+        """
+        matches = [sorted(matcher.find(name)) for name in self.names]
+        name_ptr = np.zeros(len(self.names) + 1, dtype=np.int64)
+        name_ptr[1:] = np.cumsum([len(found) for found in matches])
+        name_prof = np.fromiter(itertools.chain.from_iterable(matches), dtype=np.int64, count=int(name_ptr[-1]))
+
+        years, year_index = np.unique(self.year, return_inverse=True)
+        pairs, pair_index = np.unique(year_index.astype(np.int64) * len(self.names) + self.name, return_inverse=True)
+        pair_sums = np.bincount(pair_index, weights=self.salary, minlength=len(pairs))
+        pair_counts = np.bincount(pair_index, minlength=len(pairs))
+        pair_year, pair_name = pairs // len(self.names), pairs % len(self.names)
+
+        repeats = name_ptr[pair_name + 1] - name_ptr[pair_name]
+        expanded = np.repeat(np.arange(len(pairs)), repeats)
+        offsets = np.arange(len(expanded)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        prof = name_prof[name_ptr[pair_name[expanded]] + offsets]
+
+        key = prof * len(years) + pair_year[expanded]
+        size = count_professions * len(years)
+        sums = np.bincount(key, weights=pair_sums[expanded], minlength=size).reshape(count_professions, len(years))
+        counts = np.bincount(key, weights=pair_counts[expanded], minlength=size).reshape(count_professions, len(years))
+        return [{int(years[i]): (float(sums[index, i]), int(counts[index, i]))
+                 for i in range(len(years)) if counts[index, i]} for index in range(count_professions)]
+
+    def save(self, directory: str):
+        """Сохраняет колонки в папку: массивы в .npy, справочники городов и названий в json.
+
+        :param directory: Папка для сохранения.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for column in self.__columns:
+            np.save(os.path.join(directory, column + '.npy'), getattr(self, column))
+        with open(os.path.join(directory, 'categories.json'), 'w', encoding='utf-8') as file:
+            json.dump({'areas': self.areas, 'names': self.names}, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'VacancyColumns':
+        """Загружает колонки, сохранённые методом save.
+
+        :param directory: Папка с колонками.
+        :param mmap: Отображать массивы в память, а не читать их целиком.
+        :return: Колоночное хранилище.
+        """
+        arrays = [np.load(os.path.join(directory, column + '.npy'), mmap_mode='r' if mmap else None)
+                  for column in cls.__columns]
+        with open(os.path.join(directory, 'categories.json'), encoding='utf-8') as file:
+            categories = json.load(file)
+        return cls(*arrays, categories['areas'], categories['names'])
 
-    def group_by_year_with_name(self, name: str) -> Dict[int, List[Vacancy]]:
-        """Группирует массивы вакансий по годам только для конкретной профессии.
+    __columns = ('salary', 'year', 'area', 'name')
 
-        :param name: Название профессии.
-        :return: Словарь {год: массив вакнсий}.
+
+class NameIndex:
+    """Триграммный инвертированный индекс по уникальным названиям вакансий.
+
+    Для каждой триграммы хранится список кодов названий, для каждого кода названия - номера строк.
+    Поиск профессии пересекает списки её триграмм, проверяет подстроку только у кандидатов
+    и возвращает только их строки.
+    """
+
+    def __init__(self, names: List[str], trigrams: List[str], postings_ptr: np.ndarray, postings: np.ndarray,
+                 row_order: np.ndarray, row_ptr: np.ndarray):
+        """Инициализирует объект NameIndex.
+
+        :param names: Названия вакансий по кодам.
+        :param trigrams: Триграммы индекса.
+        :param postings_ptr: Границы списков кодов названий для каждой триграммы.
+        :param postings: Коды названий, подряд для всех триграмм.
+        :param row_order: Номера строк, упорядоченные по коду названия.
+        :param row_ptr: Границы строк каждого кода названия в row_order.
+        """
+        self.names = names
+        self.trigrams = {trigram: index for index, trigram in enumerate(trigrams)}
+        self.postings_ptr = postings_ptr
+        self.postings = postings
+        self.row_order = row_order
+        self.row_ptr = row_ptr
+
+    @classmethod
+    def build(cls, columns: VacancyColumns) -> 'NameIndex':
+        """Строит индекс по колоночному хранилищу.
+
+        :param columns: Колоночное хранилище вакансий.
+        :return: Индекс названий.
+        """
+        by_trigram: Dict[str, List[int]] = {}
+        for code, name in enumerate(columns.names):
+            for trigram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                by_trigram.setdefault(trigram, []).append(code)
+        postings_ptr = np.zeros(len(by_trigram) + 1, dtype=np.int64)
+        postings_ptr[1:] = np.cumsum([len(codes) for codes in by_trigram.values()])
+        postings = np.fromiter(itertools.chain.from_iterable(by_trigram.values()), dtype=np.int32,
+                               count=int(postings_ptr[-1]))
+        row_ptr = np.zeros(len(columns.names) + 1, dtype=np.int64)
+        row_ptr[1:] = np.cumsum(np.bincount(columns.name, minlength=len(columns.names)))
+        row_order = np.argsort(columns.name, kind='stable').astype(np.int64)
+        return cls(columns.names, list(by_trigram), postings_ptr, postings, row_order, row_ptr)
+
+    def save(self, directory: str):
+        """Сохраняет индекс в папку рядом с колонками.
+
+        :param directory: Папка для сохранения.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for array_name in self.__arrays:
+            np.save(os.path.join(directory, f'index_{array_name}.npy'), getattr(self, array_name))
+        with open(os.path.join(directory, 'index_trigrams.json'), 'w', encoding='utf-8') as file:
+            json.dump(list(self.trigrams), file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, names: List[str], mmap: bool = True) -> 'NameIndex':
+        """Загружает индекс, сохранённый методом save.
+
+        :param directory: Папка с индексом.
+        :param names: Названия вакансий по кодам.
+        :param mmap: Отображать массивы в память, а не читать их целиком.
+        :return: Индекс названий.
+        """
+        with open(os.path.join(directory, 'index_trigrams.json'), encoding='utf-8') as file:
+            trigrams = json.load(file)
+        arrays = [np.load(os.path.join(directory, f'index_{array_name}.npy'), mmap_mode='r' if mmap else None)
+                  for array_name in cls.__arrays]
+        return cls(names, trigrams, *arrays)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """Проверяет, сохранён ли индекс в папке.
+
+        :param directory: Папка.
+        :return: True, если индекс сохранён.
+        """
+        return os.path.exists(os.path.join(directory, 'index_trigrams.json'))
+
+    def name_codes(self, prof_name: str) -> np.ndarray:
+        """Находит коды названий, содержащих название профессии.
+
+        :param prof_name: Название профессии.
+        :return: Отсортированный массив кодов названий.
+        """
+        trigrams = {prof_name[i:i + 3] for i in range(len(prof_name) - 2)}
+        if not trigrams:
+            candidates = range(len(self.names))
+        elif not all(trigram in self.trigrams for trigram in trigrams):
+            return np.zeros(0, dtype=np.int32)
+        else:
+            lists = sorted((self.postings[self.postings_ptr[index]:self.postings_ptr[index + 1]]
+                            for index in map(self.trigrams.get, trigrams)), key=len)
+            candidates = lists[0]
+            for codes in lists[1:]:
+                candidates = np.intersect1d(candidates, codes, assume_unique=True)
+        return np.array([code for code in candidates if prof_name in self.names[code]], dtype=np.int32)
+
+    def rows(self, prof_name: str) -> np.ndarray:
+        """Находит номера строк вакансий, в названии которых есть название профессии.
+
+        :param prof_name: Название профессии.
+        :return: Отсортированный массив номеров строк.
+        """
+        parts = [self.row_order[self.row_ptr[code]:self.row_ptr[code + 1]] for code in self.name_codes(prof_name)]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    __arrays = ('postings_ptr', 'postings', 'row_order', 'row_ptr')
+
+
+class ColumnsCache:
+    """Дисковый кэш разобранных колонок вакансий.
+
+    Запись кэша - папка с VacancyColumns, её имя - отпечаток исходного файла: путь, размер, время изменения
+    и хэш выборки содержимого. Любое изменение файла даёт новый отпечаток, старые записи того же файла
+    удаляются. Общий размер кэша ограничен, при превышении удаляются давно не читавшиеся записи.
+    В meta.json записи вместе с отпечатком хранятся счётчики принятых и отброшенных строк, чтобы
+    при попадании в кэш они были такими же, как при разборе.
+    """
+
+    def __init__(self, cache_dir: str = '.vacancy_cache', max_bytes: int = 1 << 30):
+        """Инициализирует объект ColumnsCache.
+
+        :param cache_dir: Папка кэша.
+        :param max_bytes: Максимальный общий размер кэша в байтах.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def get(self, file_name: str, build: Callable[[], Tuple[VacancyColumns, Tuple[int, Dict[str, int]]]],
+            rates: CurrencyRates = None) -> Tuple[VacancyColumns, Tuple[int, Dict[str, int]]]:
+        """Возвращает колонки файла из кэша, при промахе строит их и сохраняет.
+
+        :param file_name: Имя исходного csv файла.
+        :param build: Функция, разбирающая файл в колонки и возвращающая их вместе со счётчиками строк.
+        :param rates: Курсы валют, по которым build пересчитывает ЗП.
+        :return: Tuple из колоночного хранилища и Tuple из количества принятых строк и словаря
+            {причина: количество отброшенных строк}.
+        """
+        fingerprint = self.fingerprint(file_name, rates)
+        entry = os.path.join(self.cache_dir, fingerprint['key'])
+        meta_path = os.path.join(entry, 'meta.json')
+        if os.path.exists(meta_path):
+            os.utime(meta_path)
+            with open(meta_path, encoding='utf-8') as file:
+                meta = json.load(file)
+            return VacancyColumns.load(entry), (meta['accepted'], meta['rejects'])
+
+        columns, (accepted, rejects) = build()
+        self.__remove_stale(fingerprint)
+        temp_entry = entry + f'.tmp{os.getpid()}'
+        columns.save(temp_entry)
+        with open(os.path.join(temp_entry, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({**fingerprint, 'accepted': accepted, 'rejects': rejects}, file, ensure_ascii=False)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(temp_entry, entry)
+        self.__evict(keep=entry)
+        return columns, (accepted, rejects)
+
+    def get_index(self, file_name: str, columns: VacancyColumns, rates: CurrencyRates = None) -> NameIndex:
+        """Возвращает индекс названий из записи кэша файла, при отсутствии строит его и сохраняет в запись.
+
+        :param file_name: Имя исходного csv файла.
+        :param columns: Колонки этого файла, полученные через get.
+        :param rates: Курсы валют, с которыми были получены колонки.
+        :return: Индекс названий.
+        """
+        entry = os.path.join(self.cache_dir, self.fingerprint(file_name, rates)['key'])
+        if NameIndex.exists(entry):
+            return NameIndex.load(entry, columns.names)
+        index = NameIndex.build(columns)
+        if os.path.isdir(entry):
+            index.save(entry)
+            self.__evict(keep=entry)
+        return index
+
+    @staticmethod
+    def fingerprint(file_name: str, rates: CurrencyRates = None) -> Dict:
+        """Считает отпечаток файла.
+
+        Содержимое хэшируется выборочно (начало, конец и блоки через равные промежутки),
+        чтобы проверка кэша не читала весь файл.
+
+        :param file_name: Имя файла.
+        :param rates: Курсы валют, с которыми строятся колонки.
+        :return: Словарь с путём, размером, временем изменения, хэшем содержимого, курсов и ключом записи.
         """
-        dict_years = {}
-        for vacancy in self.__list_vacs:
-            if name in vacancy.name:
-                if not dict_years.keys().__contains__(vacancy.year):
-                    dict_years[vacancy.year] = [vacancy]
+        path = os.path.abspath(file_name)
+        stat = os.stat(path)
+        block_size, count_blocks = 1 << 16, 16
+        content = hashlib.blake2b()
+        with open(path, 'rb') as file:
+            for index in range(count_blocks + 1):
+                file.seek(max(0, (stat.st_size - block_size) * index // count_blocks))
+                content.update(file.read(block_size))
+        fingerprint = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                       'content': content.hexdigest(), 'rates': None if rates is None else rates.fingerprint(),
+                       'version': ColumnsCache.__version}
+        fingerprint['key'] = hashlib.blake2b(json.dumps(fingerprint, sort_keys=True).encode(),
+                                             digest_size=16).hexdigest()
+        return fingerprint
+
+    def __entries(self) -> List[Tuple[str, Dict]]:
+        """Список записей кэша с их метаданными.
+
+        :return: Список (папка записи, метаданные).
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            if '.tmp' in key:
+                continue
+            meta_path = os.path.join(self.cache_dir, key, 'meta.json')
+            if os.path.exists(meta_path):
+                with open(meta_path, encoding='utf-8') as file:
+                    entries.append((os.path.join(self.cache_dir, key), json.load(file)))
+        return entries
+
+    def __remove_stale(self, fingerprint: Dict):
+        """Удаляет записи, построенные по прошлым версиям того же файла.
+
+        :param fingerprint: Отпечаток текущей версии файла.
+        """
+        for entry, meta in self.__entries():
+            if meta['path'] == fingerprint['path'] and any(
+                    meta.get(field) != fingerprint[field] for field in ('size', 'mtime_ns', 'content', 'version')):
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def __evict(self, keep: str):
+        """Удаляет давно не читавшиеся записи, пока кэш больше max_bytes.
+
+        :param keep: Запись, которую удалять нельзя.
+        """
+        entries = []
+        for entry, _ in self.__entries():
+            size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+            entries.append((os.path.getmtime(os.path.join(entry, 'meta.json')), size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+    __version = 2
+
+
+class VacancyFile:
+    """Сжатый колоночный файл вакансий для повторных загрузок без разбора csv.
+
+    Файл - архив numpy .npz со сжатием deflate. Строки разбиты на группы по годам, каждая колонка группы
+    лежит отдельным массивом '<колонка>/<год>', поэтому загрузка распаковывает только нужные колонки
+    (проекция) и годы (отбор по году). Год группы в строках не хранится. Город, валюта и название
+    вакансии закодированы номерами в словарях, ЗП хранится уже пересчитанной в рубли. Словари, годы
+    в порядке первого появления, счётчики строк и отпечаток курсов лежат в json массиве 'meta'.
+    """
+    columns = ('salary', 'year', 'area', 'name', 'currency')
+    dtypes = {'salary': 'float64', 'year': 'int16', 'area': 'int32', 'name': 'int32', 'currency': 'int32'}
+
+    def __init__(self, file_name: str):
+        """Читает метаданные файла.
+
+        :param file_name: Имя файла, созданного методом convert.
+        """
+        self.file_name = file_name
+        with np.load(file_name) as archive:
+            meta = json.loads(archive['meta'].tobytes().decode('utf-8'))
+        if meta.get('version') != self.__version:
+            raise Exception(f'Неподдерживаемая версия колоночного файла {file_name}, его нужно пересоздать')
+        self.years: List[int] = meta['years']
+        self.counts: List[int] = meta['counts']
+        self.areas: List[str] = meta['areas']
+        self.names: List[str] = meta['names']
+        self.currencies: List[str] = meta['currencies']
+        self.accepted: int = meta['accepted']
+        self.rejects: Dict[str, int] = meta['rejects']
+        self.rates: str = meta['rates']
+
+    @staticmethod
+    def is_vacancy_file(file_name: str) -> bool:
+        """Проверяет, что файл - архив npz (колоночный файл), а не csv.
+
+        :param file_name: Имя файла.
+        :return: True, если файл начинается с сигнатуры zip.
+        """
+        if not os.path.isfile(file_name):
+            return False
+        with open(file_name, 'rb') as file:
+            return file.read(4) == b'PK\x03\x04'
+
+    @classmethod
+    def convert(cls, csv_name: str, file_name: str, rates: CurrencyRates = None) -> 'VacancyFile':
+        """Преобразует csv выгрузку в колоночный файл.
+
+        :param csv_name: Имя csv файла.
+        :param file_name: Имя колоночного файла.
+        :param rates: Курсы валют для пересчёта ЗП, по умолчанию - фиксированные курсы.
+        :return: Созданный файл.
+        """
+        rates = rates or CurrencyRates()
+        reader = MappedCsvReader(csv_name)
+        schema = RecordSchema(reader.headers)
+        currency_index = RecordSchema.fields.index('salary_currency')
+        currency_codes: Dict[str, int] = {}
+        currency = array.array('i')
+
+        def tracked(records: Iterator[Tuple[str, ...]]) -> Iterator[Tuple[str, ...]]:
+            for record in records:
+                currency.append(currency_codes.setdefault(record[currency_index], len(currency_codes)))
+                yield record
+
+        columns = VacancyColumns.from_records(tracked(reader.records(schema)), rates)
+        currency = np.frombuffer(currency, dtype=np.int32)
+        order = np.argsort(columns.year, kind='stable')
+        year = columns.year[order]
+        bounds = np.flatnonzero(np.diff(year)) + 1
+        starts = np.concatenate(([0], bounds)).astype(np.int64)
+        ends = np.append(bounds, len(year)).astype(np.int64)
+        groups = sorted(zip(starts.tolist(), ends.tolist()), key=lambda bound: int(order[bound[0]]))
+        arrays = {}
+        for start, end in groups:
+            rows = order[start:end]
+            for column, values in (('salary', columns.salary), ('area', columns.area), ('name', columns.name),
+                                   ('currency', currency)):
+                arrays[f'{column}/{year[start]}'] = values[rows]
+        meta = {'version': cls.__version, 'years': [int(year[start]) for start, _ in groups],
+                'counts': [end - start for start, end in groups], 'areas': columns.areas, 'names': columns.names,
+                'currencies': list(currency_codes), 'accepted': schema.accepted, 'rejects': schema.rejects,
+                'rates': rates.fingerprint()}
+        temp_name = file_name + f'.tmp{os.getpid()}'
+        with open(temp_name, 'wb') as file:
+            np.savez_compressed(file, meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'),
+                                                         dtype=np.uint8), **arrays)
+        os.replace(temp_name, file_name)
+        return cls(file_name)
+
+    def select_years(self, years: Tuple[int, int] = None) -> List[Tuple[int, int]]:
+        """Отбирает группы строк по годам.
+
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все годы.
+        :return: Список (год, количество строк) в порядке первого появления годов.
+        """
+        return [(year, count) for year, count in zip(self.years, self.counts)
+                if years is None or years[0] <= year <= years[1]]
+
+    def read(self, columns: Iterable[str] = ('salary', 'year', 'area', 'name'),
+             years: Tuple[int, int] = None) -> Dict[str, np.ndarray]:
+        """Читает выбранные колонки выбранных годов, остальные массивы архива не распаковываются.
+
+        :param columns: Колонки из VacancyFile.columns.
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все годы.
+        :return: Словарь {колонка: массив}. area, name и currency - номера в areas, names и currencies.
+        """
+        unknown = [column for column in columns if column not in self.columns]
+        if unknown:
+            raise Exception(f"В колоночном файле нет колонок: {', '.join(unknown)}")
+        groups = self.select_years(years)
+        result = {}
+        with np.load(self.file_name) as archive:
+            for column in columns:
+                parts = [np.full(count, year, dtype=np.int16) if column == 'year' else archive[f'{column}/{year}']
+                         for year, count in groups]
+                result[column] = np.concatenate(parts) if parts else np.zeros(0, dtype=self.dtypes[column])
+        return result
+
+    def to_columns(self, years: Tuple[int, int] = None, rates: CurrencyRates = None) -> VacancyColumns:
+        """Загружает колонки, нужные DataSet, в колоночное хранилище.
+
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все годы.
+        :param rates: Курсы валют, которые ожидает вызывающий код. Должны совпадать с курсами,
+            по которым ЗП пересчитаны при преобразовании.
+        :return: Колоночное хранилище.
+        """
+        if (rates or CurrencyRates()).fingerprint() != self.rates:
+            raise Exception(f'ЗП в файле {self.file_name} пересчитаны по другим курсам валют, '
+                            f'его нужно пересоздать с этими курсами')
+        arrays = self.read(('salary', 'year', 'area', 'name'), years)
+        return VacancyColumns(arrays['salary'], arrays['year'], arrays['area'], arrays['name'], self.areas, self.names)
+
+    __version = 1
+
+
+class YearPartitions:
+    """Выгрузка, разбитая на csv файлы по годам публикации.
+
+    Папка разбиения содержит файл <год>.csv на каждый год - строки исходной выгрузки без изменений
+    и с теми же заголовками - и partitions.json: заголовки, годы в порядке первого появления, количество
+    строк по годам и строки, отброшенные при разбиении. Год строки - первые 4 символа published_at,
+    как в Vacancy. Строки с неверным количеством полей или пустым published_at ни в один год не попадают,
+    остальные проверки RecordSchema выполняются при чтении файлов годов. Порядок годов - по первой строке,
+    прошедшей все проверки, как при чтении исходной выгрузки.
+    """
+    manifest = 'partitions.json'
+
+    def __init__(self, directory: str):
+        """Читает описание разбиения.
+
+        :param directory: Папка, созданная методом split.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, self.manifest), encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != self.__version:
+            raise Exception(f'Неподдерживаемая версия разбиения {directory}, его нужно пересоздать')
+        self.headers: List[str] = manifest['headers']
+        self.years: List[int] = manifest['years']
+        self.counts: List[int] = manifest['counts']
+        self.rejects: Dict[str, int] = manifest['rejects']
+
+    @classmethod
+    def is_partitioned(cls, path: str) -> bool:
+        """Проверяет, что путь - папка разбиения, а не файл.
+
+        :param path: Путь.
+        :return: True, если в папке есть описание разбиения.
+        """
+        return os.path.isfile(os.path.join(path, cls.manifest))
+
+    @classmethod
+    def split(cls, file_name: str, directory: str) -> 'YearPartitions':
+        """Разбивает csv выгрузку на файлы по годам за один проход.
+
+        Файлы прошлого разбиения в той же папке, которых нет в новом, удаляются.
+
+        :param file_name: Имя csv файла.
+        :param directory: Папка разбиения.
+        :return: Созданное разбиение.
+        """
+        os.makedirs(directory, exist_ok=True)
+        suffix = f'.tmp{os.getpid()}'
+        files, writers = {}, {}
+        counts: Dict[int, int] = {}
+        first_valid: Dict[int, None] = {}
+        rejects: Dict[str, int] = {}
+        try:
+            with open(file_name, newline='') as source:
+                reader = csv.reader(source)
+                headers = next(reader, [])
+                schema = RecordSchema(headers)
+                project = operator.itemgetter(*schema.indices)
+                published = schema.indices[RecordSchema.fields.index('published_at')]
+                width = len(headers)
+                for row in reader:
+                    if len(row) != width:
+                        reason = 'field_count'
+                    elif not row[published]:
+                        reason = 'empty_published_at'
+                    else:
+                        year = int(row[published][:4])
+                        writer = writers.get(year)
+                        if writer is None:
+                            files[year] = open(os.path.join(directory, cls.__file_name(year) + suffix), 'w',
+                                               newline='')
+                            writer = writers[year] = csv.writer(files[year])
+                            writer.writerow(headers)
+                        writer.writerow(row)
+                        counts[year] = counts.get(year, 0) + 1
+                        if year not in first_valid and '' not in project(row):
+                            first_valid[year] = None
+                        continue
+                    rejects[reason] = rejects.get(reason, 0) + 1
+        finally:
+            for file in files.values():
+                file.close()
+
+        stale = YearPartitions(directory).years if cls.is_partitioned(directory) else []
+        for year in files:
+            os.replace(os.path.join(directory, cls.__file_name(year) + suffix),
+                       os.path.join(directory, cls.__file_name(year)))
+        years = list(first_valid) + [year for year in counts if year not in first_valid]
+        manifest = {'version': cls.__version, 'source': os.path.abspath(file_name), 'headers': headers,
+                    'years': years, 'counts': [counts[year] for year in years], 'rejects': rejects}
+        with open(os.path.join(directory, cls.manifest + suffix), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(os.path.join(directory, cls.manifest + suffix), os.path.join(directory, cls.manifest))
+        for year in stale:
+            if year not in counts:
+                os.remove(os.path.join(directory, cls.__file_name(year)))
+        return cls(directory)
+
+    def files(self, years: Tuple[int, int] = None) -> List[str]:
+        """Файлы годов из диапазона.
+
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все годы.
+        :return: Имена файлов в порядке первого появления годов в исходной выгрузке.
+        """
+        return [os.path.join(self.directory, self.__file_name(year)) for year in self.years
+                if years is None or years[0] <= year <= years[1]]
+
+    @staticmethod
+    def __file_name(year: int) -> str:
+        """Имя файла года внутри папки разбиения.
+
+        :param year: Год.
+        :return: Имя файла.
+        """
+        return f'{year}.csv'
+
+    __version = 1
+
+
+class SalaryAggregator:
+    """Однопроходный подсчёт статистики ЗП для отчётов.
+
+    За один проход по вакансиям (или по уже свёрнутым группам) накапливает сумму ЗП и количество
+    по годам, по годам выбранной профессии, по городам и по годам дополнительных профессий.
+    Списки вакансий по группам не строятся. Профессии ищутся один раз на уникальное название,
+    дополнительные - автоматом Ахо-Корасик. Результат переводится в словари отчётов через
+    DataSet.from_aggregator. По отдельным вакансиям можно вести и распределения ЗП по годам и городам.
+    """
+
+    def __init__(self, prof_name: str, professions: List[str] = (), distributions: bool = False):
+        """Инициализирует пустой подсчёт.
+
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии.
+        :param distributions: Вести SalaryDistribution по годам и городам в add.
+        """
+        self.prof_name = prof_name
+        self.professions = list(professions)
+        self.by_year: Dict[int, List] = {}
+        self.by_year_name: Dict[int, List] = {}
+        self.by_city: Dict[str, List] = {}
+        self.by_profession: List[Dict[int, List]] = [{} for _ in self.professions]
+        self.__matcher = AhoCorasick(self.professions) if self.professions else None
+        self.__matches: Dict[str, Tuple[bool, Set[int]]] = {}
+        self.__distributions = distributions
+        self.distribution_by_year: Dict[int, SalaryDistribution] = {}
+        self.distribution_by_city: Dict[str, SalaryDistribution] = {}
+
+    def add(self, vacancies: Iterable[Vacancy]) -> 'SalaryAggregator':
+        """Добавляет вакансии.
+
+        :param vacancies: Итератор по вакансиям или объектам с теми же полями.
+        :return: Этот же объект.
+        """
+        if not self.__distributions:
+            for vacancy in vacancies:
+                self.__add(vacancy.year, vacancy.area_name, vacancy.name, vacancy.salary, 1)
+            return self
+        by_year, by_city = self.distribution_by_year, self.distribution_by_city
+        for vacancy in vacancies:
+            self.__add(vacancy.year, vacancy.area_name, vacancy.name, vacancy.salary, 1)
+            distribution = by_year.get(vacancy.year)
+            if distribution is None:
+                distribution = by_year[vacancy.year] = SalaryDistribution()
+            distribution.add(vacancy.salary)
+            distribution = by_city.get(vacancy.area_name)
+            if distribution is None:
+                distribution = by_city[vacancy.area_name] = SalaryDistribution()
+            distribution.add(vacancy.salary)
+        return self
+
+    def add_groups(self, groups: Iterable[Tuple[int, str, str, float, int]]) -> 'SalaryAggregator':
+        """Добавляет уже свёрнутые группы вакансий. Распределения ЗП по группам не ведутся.
+
+        :param groups: Итератор по кортежам (год, город, название, сумма ЗП, количество).
+        :return: Этот же объект.
+        """
+        for year, city, name, salary_sum, count in groups:
+            self.__add(year, city, name, salary_sum, count)
+        return self
+
+    def merge(self, stats: Tuple[Dict, Dict, Dict, List[Dict]]) -> 'SalaryAggregator':
+        """Добавляет результат другого подсчёта с теми же профессиями, например по части файла.
+
+        :param stats: Результат result() другого подсчёта.
+        :return: Этот же объект.
+        """
+        for target, part in zip((self.by_year, self.by_year_name, self.by_city, *self.by_profession),
+                                (*stats[:3], *stats[3])):
+            for key, (salary_sum, count) in part.items():
+                self.__accumulate(target, key, salary_sum, count)
+        return self
+
+    def merge_distributions(self, by_year: Dict[int, SalaryDistribution],
+                            by_city: Dict[str, SalaryDistribution]) -> 'SalaryAggregator':
+        """Добавляет распределения ЗП другого подсчёта.
+
+        :param by_year: Распределения по годам.
+        :param by_city: Распределения по городам.
+        :return: Этот же объект.
+        """
+        for target, part in ((self.distribution_by_year, by_year), (self.distribution_by_city, by_city)):
+            for key, distribution in part.items():
+                if key in target:
+                    target[key].merge(distribution)
                 else:
-                    dict_years[vacancy.year].append(vacancy)
-        return dict_years
+                    target[key] = distribution
+        return self
+
+    def result(self) -> Tuple[Dict, Dict, Dict, List[Dict]]:
+        """Накопленные суммы и количества.
+
+        :return: Словари {год: [сумма, количество]}, то же для профессии, {город: [сумма, количество]}
+            и массив словарей {год: [сумма, количество]} по дополнительным профессиям.
+        """
+        return self.by_year, self.by_year_name, self.by_city, self.by_profession
+
+    def __add(self, year: int, city: str, name: str, salary_sum: float, count: int):
+        """Добавляет группу вакансий с одним годом, городом и названием.
+
+        :param year: Год.
+        :param city: Город.
+        :param name: Название вакансии.
+        :param salary_sum: Сумма ЗП.
+        :param count: Количество вакансий.
+        """
+        matches = self.__matches.get(name)
+        if matches is None:
+            matches = self.__matches[name] = (self.prof_name in name,
+                                              self.__matcher.find(name) if self.__matcher is not None else set())
+        self.__accumulate(self.by_year, year, salary_sum, count)
+        if matches[0]:
+            self.__accumulate(self.by_year_name, year, salary_sum, count)
+        self.__accumulate(self.by_city, city, salary_sum, count)
+        for index in matches[1]:
+            self.__accumulate(self.by_profession[index], year, salary_sum, count)
+
+    @staticmethod
+    def __accumulate(stats: Dict, key, salary_sum: float, count: int):
+        """Добавляет сумму и количество ЗП к группе.
+
+        :param stats: Словарь {ключ: [сумма ЗП, количество]}.
+        :param key: Ключ группы.
+        :param salary_sum: Сумма ЗП.
+        :param count: Количество.
+        """
+        stat = stats.get(key)
+        if stat is None:
+            stats[key] = [salary_sum, count]
+        else:
+            stat[0] += salary_sum
+            stat[1] += count
+
+
+class AggregateState:
+    """Накопленные суммы и количества ЗП по ключу (год, город, название вакансии).
+
+    Состояние хранится в json файле и дополняется новыми выгрузками, поэтому ежедневное обновление
+    требует чтения только новой выгрузки. Из состояния строится DataSet для любой профессии через
+    DataSet.from_aggregates. Уже добавленные файлы запоминаются по отпечатку содержимого
+    и повторно не учитываются.
+    """
+
+    def __init__(self):
+        """Инициализирует пустое состояние.
 
-    def group_by_city(self) -> Tuple[Dict[str, List[Vacancy]], Dict[str, float]]:
-        """Группирует массивы вакансий по городам.
+        """
+        self.stats: Dict[Tuple[int, str, str], List] = {}
+        self.sources: List[str] = []
+
+    @classmethod
+    def load(cls, file_name: str) -> 'AggregateState':
+        """Загружает состояние из файла, при отсутствии файла возвращает пустое.
+
+        :param file_name: Имя файла состояния.
+        :return: Состояние.
+        """
+        state = cls()
+        if not os.path.exists(file_name):
+            return state
+        with open(file_name, encoding='utf-8') as file:
+            data = json.load(file)
+        state.sources = data['sources']
+        state.stats = {(year, city, name): [salary_sum, count] for year, city, name, salary_sum, count in data['stats']}
+        return state
+
+    def save(self, file_name: str):
+        """Сохраняет состояние в файл, заменяя его целиком только после успешной записи.
+
+        :param file_name: Имя файла состояния.
+        """
+        temp_name = file_name + '.tmp'
+        with open(temp_name, 'w', encoding='utf-8') as file:
+            json.dump({'sources': self.sources,
+                       'stats': [[*key, salary_sum, count] for key, (salary_sum, count) in self.stats.items()]},
+                      file, ensure_ascii=False)
+        os.replace(temp_name, file_name)
+
+    def add(self, vacancies: Iterable[Vacancy]):
+        """Добавляет вакансии к накопленным суммам и количествам.
 
-        :return: Словарь {город: массив вакнсий}.
+        :param vacancies: Итератор по вакансиям.
         """
-        dict_city = {}
-        for vacancy in self.__list_vacs:
-            if not dict_city.keys().__contains__(vacancy.area_name):
-                dict_city[vacancy.area_name] = [vacancy]
+        stats = self.stats
+        for vacancy in vacancies:
+            key = (vacancy.year, vacancy.area_name, vacancy.name)
+            stat = stats.get(key)
+            if stat is None:
+                stats[key] = [vacancy.salary, 1]
             else:
-                dict_city[vacancy.area_name].append(vacancy)
-        dict_city_more_1percent = {}
-        fraction_by_city = {}
-        for city, list_vac in dict_city.items():
-            fraction = len(dict_city[city]) / len(self.__list_vacs)
-            if fraction * 100 >= 1:
-                dict_city_more_1percent[city] = list_vac
-                fraction_by_city[city] = round(fraction, 4)
-        return dict_city_more_1percent, dict(sorted(fraction_by_city.items(), key=lambda x: x[1], reverse=True))
+                stat[0] += vacancy.salary
+                stat[1] += 1
+
+    def add_file(self, file_name: str, rates: CurrencyRates = None) -> bool:
+        """Добавляет выгрузку, если она ещё не была добавлена.
+
+        :param file_name: Имя csv файла.
+        :param rates: Курсы валют по периодам.
+        :return: True, если файл добавлен, False - если он уже был учтён.
+        """
+        source = self.content_hash(file_name)
+        if source in self.sources:
+            return False
+        self.add(DataSet.read_vacancies(file_name, rates))
+        self.sources.append(source)
+        return True
+
+    @staticmethod
+    def content_hash(file_name: str) -> str:
+        """Хэш всего содержимого файла для учёта добавленных выгрузок.
+
+        В отличие от ColumnsCache.fingerprint файл читается целиком: выгрузки одного размера, различающиеся
+        вне выборочных блоков, не должны считаться одной. Хэш считается один раз на добавление файла,
+        который всё равно читается полностью.
+
+        :param file_name: Имя файла.
+        :return: Строка 'blake2b:<шестнадцатеричный хэш>'.
+        """
+        content = hashlib.blake2b()
+        with open(file_name, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                content.update(block)
+        return f'blake2b:{content.hexdigest()}'
+
+    def group(self, prof_name: str, professions: List[str] = ()) -> Tuple[Dict, Dict, Dict, List[Dict]]:
+        """Сворачивает состояние в суммы и количества ЗП по годам, годам профессии и городам.
+
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии.
+        :return: Словари сумм и количеств в том же виде, что и при разборе файла в DataSet.
+        """
+        return SalaryAggregator(prof_name, professions).add_groups(
+            (*key, salary_sum, count) for key, (salary_sum, count) in self.stats.items()).result()
+
+
+class SalaryCube:
+    """Куб сумм и количеств ЗП по измерениям год × город × название вакансии × валюта оклада.
+
+    Строится один раз по выгрузке, после чего любые срезы отвечаются по ячейкам куба без чтения строк:
+    roll_up сворачивает куб до выбранных измерений, slice фиксирует значение одного измерения, dice
+    отбирает ячейки по нескольким измерениям. ЗП в ячейках уже пересчитаны в рубли. Итоговые словари
+    DataSet строятся из куба через DataSet.from_cube.
+    """
+    dimensions = ('year', 'city', 'name', 'currency')
+
+    def __init__(self, cells: Dict[Tuple[int, str, str, str], List] = None):
+        """Инициализирует куб.
 
-    def salary_by_years(self, dict_vacs: Dict[int, List[Vacancy]]) -> Dict[int, float]:
-        """Группирует массив ЗП по годам.
+        :param cells: Словарь {(год, город, название, валюта): [сумма ЗП, количество]}, по умолчанию - пустой.
+        """
+        self.cells: Dict[Tuple[int, str, str, str], List] = cells if cells is not None else {}
+
+    @classmethod
+    def from_file(cls, file_name: str, rates: CurrencyRates = None) -> 'SalaryCube':
+        """Строит куб по csv файлу за один проход.
+
+        :param file_name: Имя csv файла.
+        :param rates: Курсы валют по периодам.
+        :return: Куб.
+        """
+        return cls().add_records(DataSet.read_records(file_name), rates)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def add_records(self, records: Iterable[Tuple[str, ...]], rates: CurrencyRates = None) -> 'SalaryCube':
+        """Добавляет записи RecordSchema к ячейкам куба.
+
+        :param records: Итератор по записям в порядке RecordSchema.fields.
+        :param rates: Курсы валют по периодам.
+        :return: Этот же куб.
+        """
+        cells = self.cells
+        currency_index = RecordSchema.fields.index('salary_currency')
+        for record in records:
+            vacancy = Vacancy.from_record(record, rates)
+            key = (vacancy.year, vacancy.area_name, vacancy.name, record[currency_index])
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [vacancy.salary, 1]
+            else:
+                cell[0] += vacancy.salary
+                cell[1] += 1
+        return self
+
+    def merge(self, other: 'SalaryCube') -> 'SalaryCube':
+        """Добавляет ячейки другого куба, например построенного по другой выгрузке.
+
+        :param other: Куб.
+        :return: Этот же куб.
+        """
+        for key, (salary_sum, count) in other.cells.items():
+            cell = self.cells.get(key)
+            if cell is None:
+                self.cells[key] = [salary_sum, count]
+            else:
+                cell[0] += salary_sum
+                cell[1] += count
+        return self
+
+    def roll_up(self, *dimensions: str) -> Dict:
+        """Сворачивает куб до выбранных измерений, суммируя остальные.
 
-        :param dict_vacs: Словарь вакансий по годам.
-        :return: Словарь {год: средняя ЗП}
+        :param dimensions: Измерения из SalaryCube.dimensions.
+        :return: Словарь {значение: [сумма ЗП, количество]} для одного измерения, {кортеж значений: [...]}
+            для нескольких и {(): [...]} без измерений.
         """
-        ready_dict = {}
-        for year in self.years:
-            if dict_vacs.keys().__contains__(year):
-                ready_dict[year] = int(sum([vac.salary for vac in dict_vacs[year]]) / len(dict_vacs[year]))
+        indices = [self.__index(dimension) for dimension in dimensions]
+        key_of = operator.itemgetter(*indices) if indices else lambda key: ()
+        stats = {}
+        for key, (salary_sum, count) in self.cells.items():
+            group = key_of(key)
+            stat = stats.get(group)
+            if stat is None:
+                stats[group] = [salary_sum, count]
             else:
-                ready_dict[year] = 0
-        return ready_dict
+                stat[0] += salary_sum
+                stat[1] += count
+        return stats
+
+    def salary(self, *dimensions: str) -> Dict:
+        """Средняя ЗП по выбранным измерениям.
+
+        :param dimensions: Измерения, как в roll_up.
+        :return: Словарь {значение: средняя ЗП}.
+        """
+        return {key: int(salary_sum / count) for key, (salary_sum, count) in self.roll_up(*dimensions).items()}
+
+    def count(self, *dimensions: str) -> Dict:
+        """Количество вакансий по выбранным измерениям.
+
+        :param dimensions: Измерения, как в roll_up.
+        :return: Словарь {значение: количество вакансий}.
+        """
+        return {key: count for key, (_, count) in self.roll_up(*dimensions).items()}
+
+    def slice(self, dimension: str, value) -> 'SalaryCube':
+        """Оставляет ячейки с одним значением измерения.
+
+        :param dimension: Измерение.
+        :param value: Значение, например 2022 для year или 'Москва' для city.
+        :return: Новый куб.
+        """
+        index = self.__index(dimension)
+        return SalaryCube({key: stat for key, stat in self.cells.items() if key[index] == value})
+
+    def dice(self, **conditions) -> 'SalaryCube':
+        """Оставляет ячейки, подходящие по нескольким измерениям.
+
+        :param conditions: Условия по измерениям: коллекция допустимых значений (например,
+            year=range(2015, 2021), city={'Москва', 'Казань'}) или функция от значения.
+        :return: Новый куб.
+        """
+        checks = [(self.__index(dimension), condition if callable(condition) else condition.__contains__)
+                  for dimension, condition in conditions.items()]
+        return SalaryCube({key: stat for key, stat in self.cells.items()
+                           if all(check(key[index]) for index, check in checks)})
+
+    def profession(self, prof_name: str) -> 'SalaryCube':
+        """Оставляет ячейки вакансий, в названии которых есть название профессии, как в DataSet.
+
+        :param prof_name: Название профессии.
+        :return: Новый куб.
+        """
+        return self.dice(name=lambda name: prof_name in name)
+
+    def aggregator(self, prof_name: str, professions: List[str] = ()) -> SalaryAggregator:
+        """Сворачивает куб в подсчёт для итоговых словарей DataSet.
+
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии.
+        :return: Подсчёт по группам (год, город, название).
+        """
+        return SalaryAggregator(prof_name, professions).add_groups(
+            (*key, salary_sum, count) for key, (salary_sum, count) in self.roll_up('year', 'city', 'name').items())
 
-    def salary_by_city(self, dict_vacs: Dict[str, List[Vacancy]]) -> Dict[str, float]:
-        """Группирует ЗП по городам.
+    def __index(self, dimension: str) -> int:
+        """Номер измерения в ключе ячейки.
 
-        :param dict_vacs: Словарь вакансий по городам.
-        :return: Словарь {город: средняя ЗП}
+        :param dimension: Измерение.
+        :return: Номер.
         """
-        salary_by_city_dict = {}
-        for city, list_vacancy in dict_vacs.items():
-            salary_by_city_dict[city] = int(sum([vac.salary for vac in list_vacancy]) / len(list_vacancy))
-        return dict(sorted(salary_by_city_dict.items(), key=lambda x: x[1], reverse=True))
+        if dimension not in self.dimensions:
+            raise Exception(f'Неизвестное измерение куба: {dimension}')
+        return self.dimensions.index(dimension)
+
+
+class DataSet:
+    """Класс для обработки csv файлов
+
+    """
+    def __init__(self, file_name: str, prof_name: str, streaming: bool = False, columnar: bool = False,
+                 processes: int = 1, cache: ColumnsCache = None, professions: List[str] = None,
+                 indexed: bool = False, rates: CurrencyRates = None, metrics: 'Metrics' = None,
+                 compact: bool = False, cube: bool = False, distributions: bool = False,
+                 years: Tuple[int, int] = None):
+        """Инициализирует объект DataSet
+
+        Режимы streaming, columnar, processes больше 1, cache, cube и compact взаимоисключающие (cache сам
+        включает колоночный режим, поэтому columnar с ним допустим): при нескольких сразу выбрасывается исключение.
+
+        :param file_name: Имя csv файла, папки разбиения YearPartitions или колоночного файла VacancyFile.
+            Из разбиения читаются только файлы годов из years, при processes больше 1 - в нескольких процессах.
+            Колоночный файл всегда загружается в колоночном режиме (streaming, processes и cache не действуют)
+            и только с нужными колонками.
+        :param prof_name: Название профессии, по которой требуется более подробная информация.
+        :param streaming: Потоковый режим: статистика считается за один проход по файлу,
+            вакансии в памяти не хранятся.
+        :param columnar: Колоночный режим: вакансии хранятся в VacancyColumns,
+            статистика считается векторно.
+        :param processes: Количество процессов для параллельного разбора файла по частям.
+            При значении больше 1 вакансии в памяти не хранятся, как в потоковом режиме.
+        :param cache: Дисковый кэш колонок. Если задан, включает колоночный режим и при неизменном файле
+            загружает колонки из кэша без разбора csv.
+        :param professions: Дополнительные профессии, статистика по которым считается в том же проходе
+            и доступна через for_profession.
+        :param indexed: Построить (или загрузить из кэша) триграммный индекс названий, чтобы поиск профессии
+            затрагивал только подходящие строки. Работает в колоночном режиме и с кэшем, без cache включает
+            колоночный режим.
+        :param rates: Курсы валют по периодам для пересчёта ЗП, по умолчанию - фиксированные курсы.
+            В колоночном режиме и с кэшем ЗП пересчитываются пакетно.
+        :param metrics: Сборщик метрик: время и пик памяти по стадиям, количество прочитанных
+            и отброшенных строк. По умолчанию метрики не собираются.
+        :param compact: Хранить вакансии обычного режима как CompactVacancy: меньше памяти на строку.
+        :param cube: Построить куб SalaryCube и получить итоговые словари из него. Вакансии в памяти
+            не хранятся, куб доступен в self.cube для срезов без повторного чтения файла.
+        :param distributions: Вести распределения ЗП (квантили и гистограммы) по годам и городам
+            в distribution_by_year и distribution_by_city. В режиме куба недоступно.
+        :param years: Диапазон годов (первый, последний) включительно: остальные вакансии не учитываются.
+            Из колоночного файла и разбиения читаются только группы строк и файлы этих годов.
+            С кэшем колонок недоступно.
+        """
+        professions = professions or []
+        self.columns = None
+        self.name_index = None
+        self.professions: Dict[str, Tuple[Dict[int, int], Dict[int, int]]] = {}
+        self.metrics = metrics or Metrics(enabled=False)
+        self.rejects: Dict[str, int] = {}
+        self.cube = None
+        self.distribution_by_year: Dict[int, SalaryDistribution] = {}
+        self.distribution_by_city: Dict[str, SalaryDistribution] = {}
+        self.__list_vacs = []
+        self.__state = None
+        self.__schema = None
+        modes = [mode for mode, enabled in (('cache', cache is not None), ('processes', processes > 1),
+                                            ('streaming', streaming), ('cube', cube),
+                                            ('columnar', columnar and cache is None), ('compact', compact)) if enabled]
+        if len(modes) > 1:
+            raise Exception(f'Режимы {", ".join(modes)} несовместимы: можно выбрать только один')
+        if indexed and modes and modes[0] not in ('cache', 'columnar'):
+            raise Exception('Индекс названий строится только в колоночном режиме и с кэшем колонок')
+        columnar = columnar or indexed
+        if cube and distributions:
+            raise Exception('Распределения ЗП недоступны в режиме куба: куб не хранит отдельные ЗП')
+        vacancy_file = VacancyFile(file_name) if VacancyFile.is_vacancy_file(file_name) else None
+        if vacancy_file is not None:
+            if cube:
+                raise Exception('Колоночный файл загружается только в колоночном режиме, куб из него не строится')
+            cache, processes, streaming, columnar = None, 1, False, True
+        elif cache is not None and (years is not None or YearPartitions.is_partitioned(file_name)):
+            raise Exception('Кэш колонок хранит целый csv файл: отбор по годам и разбиение по годам с ним недоступны')
+        if cache is not None:
+            with self.metrics.stage('cache_load'):
+                self.columns, (accepted, rejects) = cache.get(
+                    file_name, lambda: self.__parse_columns(file_name, rates), rates)
+            self.__count_rows(accepted, rejects)
+            if indexed:
+                with self.metrics.stage('name_index'):
+                    self.name_index = cache.get_index(file_name, self.columns, rates)
+            with self.metrics.stage('grouping'):
+                self.__apply_columns_stats(prof_name, professions)
+            if distributions:
+                with self.metrics.stage('distributions'):
+                    self.__apply_columns_distributions()
+        elif processes > 1:
+            with self.metrics.stage('parallel_ingest'):
+                aggregator, (accepted, rejects) = self.__parallel_stats(
+                    file_name, prof_name, processes, professions, rates, distributions, years)
+            self.__count_rows(accepted, rejects)
+            with self.metrics.stage('grouping'):
+                self.__apply_aggregator(aggregator)
+        elif streaming:
+            with self.metrics.stage('ingest'):
+                aggregator = SalaryAggregator(prof_name, professions, distributions).add(
+                    Vacancy.from_record(record, rates) for record in self.__read_records(file_name, years))
+            with self.metrics.stage('grouping'):
+                self.__apply_aggregator(aggregator)
+        elif cube:
+            with self.metrics.stage('ingest'):
+                self.cube = SalaryCube().add_records(self.__read_records(file_name, years), rates)
+            with self.metrics.stage('grouping'):
+                *stats, by_profession = self.cube.aggregator(prof_name, professions).result()
+                self.__apply_stats(prof_name, *stats)
+                self.__apply_professions(professions, by_profession)
+        elif columnar:
+            with self.metrics.stage('ingest'):
+                if vacancy_file is not None:
+                    self.columns = vacancy_file.to_columns(years, rates)
+                    self.__count_rows(vacancy_file.accepted, vacancy_file.rejects)
+                else:
+                    self.columns = VacancyColumns.from_records(self.__read_records(file_name, years),
+                                                               rates or CurrencyRates())
+            if indexed:
+                with self.metrics.stage('name_index'):
+                    self.name_index = NameIndex.build(self.columns)
+            with self.metrics.stage('grouping'):
+                self.__apply_columns_stats(prof_name, professions)
+            if distributions:
+                with self.metrics.stage('distributions'):
+                    self.__apply_columns_distributions()
+        else:
+            with self.metrics.stage('ingest'):
+                vacancy_type = CompactVacancy if compact else Vacancy
+                self.__list_vacs = [vacancy_type.from_record(record, rates)
+                                    for record in self.__read_records(file_name, years)]
+            with self.metrics.stage('grouping'):
+                self.__apply_list_stats(prof_name, professions, distributions)
+        if self.__schema is not None:
+            self.__count_rows(self.__schema.accepted, self.__schema.rejects)
+        self.metrics.count('vacancies', sum(self.count_by_year_dict.values()))
+
+    def __read_records(self, file_name: str, years: Tuple[int, int] = None) -> Iterator[Tuple[str, ...]]:
+        """Потоково читает и проверяет записи csv файла по схеме RecordSchema через MappedCsvReader.
+
+        Для папки разбиения читаются по очереди файлы нужных годов, строки, отброшенные при разбиении,
+        добавляются к счётчикам схемы.
+
+        :param file_name: Имя файла или папки разбиения.
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все годы.
+        :return: Итератор по записям в порядке RecordSchema.fields.
+        """
+        if YearPartitions.is_partitioned(file_name):
+            partitions = YearPartitions(file_name)
+            self.__schema = RecordSchema(partitions.headers)
+            self.__schema.rejects.update(partitions.rejects)
+            return itertools.chain.from_iterable(MappedCsvReader(name).records(self.__schema)
+                                                 for name in partitions.files(years))
+        reader = MappedCsvReader(file_name)
+        self.__schema = RecordSchema(reader.headers)
+        return self.select_years(reader.records(self.__schema), years)
+
+    @staticmethod
+    def select_years(records: Iterable[Tuple[str, ...]], years: Tuple[int, int] = None) -> Iterator[Tuple[str, ...]]:
+        """Отбирает записи, опубликованные в диапазоне годов.
+
+        :param records: Итератор по записям в порядке RecordSchema.fields.
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все записи.
+        :return: Итератор по отобранным записям.
+        """
+        if years is None:
+            return iter(records)
+        first, last = years
+        published = RecordSchema.fields.index('published_at')
+        return (record for record in records if first <= int(record[published][:4]) <= last)
+
+    @staticmethod
+    def __parse_columns(file_name: str, rates: CurrencyRates = None) -> Tuple[VacancyColumns, Tuple[int, Dict]]:
+        """Разбирает csv файл в колонки для кэша колонок.
+
+        :param file_name: Имя файла.
+        :param rates: Курсы валют, по умолчанию - фиксированные курсы.
+        :return: Tuple из колоночного хранилища и Tuple из количества принятых строк и словаря отброшенных строк.
+        """
+        reader = MappedCsvReader(file_name)
+        schema = RecordSchema(reader.headers)
+        columns = VacancyColumns.from_records(reader.records(schema), rates or CurrencyRates())
+        return columns, (schema.accepted, schema.rejects)
+
+    def __count_rows(self, accepted: int, rejects: Dict[str, int]):
+        """Запоминает отброшенные строки по причинам и добавляет счётчики строк в метрики.
+
+        :param accepted: Количество принятых строк.
+        :param rejects: Словарь {причина: количество отброшенных строк}.
+        """
+        self.rejects = rejects
+        rejected = sum(rejects.values())
+        self.metrics.count('rows_read', accepted + rejected)
+        self.metrics.count('rows_accepted', accepted)
+        self.metrics.count('rows_rejected', rejected)
+        for reason, count in rejects.items():
+            self.metrics.count(f'rejected_{reason}', count)
+
+    def __apply_list_stats(self, prof_name: str, professions: List[str], distributions: bool = False):
+        """Заполняет итоговые словари за один проход по списку вакансий self.__list_vacs.
+
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии.
+        :param distributions: Вести распределения ЗП по годам и городам.
+        """
+        self.__apply_aggregator(SalaryAggregator(prof_name, professions, distributions).add(self.__list_vacs))
+
+    def __apply_aggregator(self, aggregator: SalaryAggregator):
+        """Заполняет итоговые словари и распределения ЗП из однопроходного подсчёта.
+
+        :param aggregator: Подсчёт.
+        """
+        *stats, by_profession = aggregator.result()
+        self.__apply_stats(aggregator.prof_name, *stats)
+        self.__apply_professions(aggregator.professions, by_profession)
+        self.distribution_by_year = aggregator.distribution_by_year
+        self.distribution_by_city = aggregator.distribution_by_city
+
+    def __apply_columns_distributions(self, mask: np.ndarray = None):
+        """Заполняет распределения ЗП по годам и городам векторно по колоночному хранилищу self.columns.
+
+        :param mask: Маска или номера отбираемых вакансий, по умолчанию - все.
+        """
+        self.distribution_by_year = self.columns.distributions('year', mask)
+        self.distribution_by_city = self.columns.distributions('city', mask)
+
+    @classmethod
+    def from_vacancies(cls, vacancies: Iterable[Vacancy], prof_name: str, professions: List[str] = None) -> 'DataSet':
+        """Строит набор данных из уже разобранных вакансий.
+
+        :param vacancies: Вакансии.
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии, как в конструкторе.
+        :return: Объект DataSet.
+        """
+        data_set = cls.__new__(cls)
+        data_set.columns = None
+        data_set.name_index = None
+        data_set.professions = {}
+        data_set.metrics = Metrics(enabled=False)
+        data_set.rejects = {}
+        data_set.cube = None
+        data_set.__list_vacs = list(vacancies)
+        data_set.__state = None
+        data_set.__apply_list_stats(prof_name, professions or [])
+        return data_set
+
+    @classmethod
+    def from_aggregates(cls, state: AggregateState, prof_name: str, professions: List[str] = None) -> 'DataSet':
+        """Строит набор данных из накопленного состояния без чтения csv.
+
+        :param state: Накопленные суммы и количества ЗП.
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии, как в конструкторе.
+        :return: Объект DataSet.
+        """
+        data_set = cls.from_aggregator(SalaryAggregator(prof_name, professions or []).add_groups(
+            (*key, salary_sum, count) for key, (salary_sum, count) in state.stats.items()))
+        data_set.__state = state
+        return data_set
+
+    @classmethod
+    def from_cube(cls, cube: SalaryCube, prof_name: str, professions: List[str] = None) -> 'DataSet':
+        """Строит набор данных из куба или его среза без чтения csv.
+
+        :param cube: Куб сумм и количеств ЗП.
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии, как в конструкторе.
+        :return: Объект DataSet.
+        """
+        data_set = cls.from_aggregator(cube.aggregator(prof_name, professions or []))
+        data_set.cube = cube
+        return data_set
+
+    @classmethod
+    def from_aggregator(cls, aggregator: SalaryAggregator) -> 'DataSet':
+        """Строит набор данных из готового однопроходного подсчёта вместе с его распределениями ЗП.
+
+        :param aggregator: Подсчёт с накопленными вакансиями или группами.
+        :return: Объект DataSet.
+        """
+        data_set = cls.__new__(cls)
+        data_set.columns = None
+        data_set.name_index = None
+        data_set.professions = {}
+        data_set.metrics = Metrics(enabled=False)
+        data_set.rejects = {}
+        data_set.cube = None
+        data_set.__list_vacs = []
+        data_set.__state = None
+        data_set.__apply_aggregator(aggregator)
+        return data_set
+
+    def for_profession(self, prof_name: str) -> 'DataSet':
+        """Возвращает копию набора данных, в которой выбранной профессией стала одна из professions.
+
+        :param prof_name: Название профессии из professions.
+        :return: Объект DataSet для построения отчёта по этой профессии.
+        """
+        data_set = copy.copy(self)
+        data_set.prof_name = prof_name
+        data_set.salary_by_year_name_dict, data_set.count_by_year_name_dict = self.professions[prof_name]
+        return data_set
+
+    def select_profession(self, prof_name: str) -> 'DataSet':
+        """Считает статистику по новой профессии без повторного чтения файла.
+
+        Доступно в колоночном режиме и с кубом; при наличии индекса названий просматриваются только
+        подходящие строки.
+
+        :param prof_name: Название профессии.
+        :return: Копия набора данных с выбранной профессией.
+        """
+        if self.columns is None and self.cube is None:
+            raise Exception('Выбор профессии без повторного чтения доступен только в колоночном режиме и с кубом')
+        data_set = copy.copy(self)
+        data_set.prof_name = prof_name
+        if self.columns is None:
+            by_year_name = self.cube.profession(prof_name).roll_up('year')
+        else:
+            by_year_name = self.columns.group_by_year(self.__profession_rows(prof_name))
+        data_set.salary_by_year_name_dict, data_set.count_by_year_name_dict = self.__year_dicts(by_year_name)
+        return data_set
+
+    def query(self, prof_name: str, city: str = None, years: Tuple[int, int] = None) -> 'DataSet':
+        """Считает всю статистику заново по части вакансий без повторного чтения файла.
+
+        Доступно в колоночном режиме и с кубом. Профессия ищется по индексу названий, если он есть.
+
+        :param prof_name: Название профессии.
+        :param city: Город, по умолчанию - все города.
+        :param years: Первый и последний год включительно, по умолчанию - все годы.
+        :return: Копия набора данных со статистикой только по отобранным вакансиям.
+        """
+        if self.columns is None and self.cube is None:
+            raise Exception('Запросы без повторного чтения доступны только в колоночном режиме и с кубом')
+        if self.columns is None:
+            cube = self.cube
+            if city is not None:
+                cube = cube.slice('city', city)
+            if years is not None:
+                cube = cube.dice(year=range(years[0], years[1] + 1))
+            data_set = copy.copy(self)
+            data_set.professions = {}
+            data_set.__apply_stats(prof_name, *cube.aggregator(prof_name).result()[:3])
+            data_set.distribution_by_year, data_set.distribution_by_city = {}, {}
+            return data_set
+        columns = self.columns
+        mask = None
+        if city is not None:
+            mask = columns.area == (columns.areas.index(city) if city in columns.areas else -1)
+        if years is not None:
+            in_years = (columns.year >= years[0]) & (columns.year <= years[1])
+            mask = in_years if mask is None else mask & in_years
+        rows = self.__profession_rows(prof_name)
+        if mask is not None:
+            rows = rows & mask if rows.dtype == bool else rows[mask[rows]]
+        data_set = copy.copy(self)
+        data_set.professions = {}
+        data_set.__apply_stats(prof_name, columns.group_by_year(mask), columns.group_by_year(rows),
+                               columns.group_by_city(mask))
+        if self.distribution_by_year:
+            data_set.__apply_columns_distributions(mask)
+        return data_set
+
+    def __profession_rows(self, prof_name: str) -> np.ndarray:
+        """Отбирает строки колонок с выбранной профессией: по индексу, если он есть, иначе маской.
+
+        :param prof_name: Название профессии.
+        :return: Массив номеров строк или булева маска.
+        """
+        if self.name_index is not None:
+            return self.name_index.rows(prof_name)
+        return self.columns.name_mask(prof_name)
+
+    def summary(self) -> 'DataSet':
+        """Возвращает копию набора данных только с итоговыми словарями, без вакансий, колонок, индекса и куба.
+
+        Такую копию дёшево передавать в другие процессы.
+
+        :return: Объект DataSet.
+        """
+        data_set = copy.copy(self)
+        data_set.columns = None
+        data_set.name_index = None
+        data_set.metrics = Metrics(enabled=False)
+        data_set.cube = None
+        data_set.__list_vacs = []
+        data_set.__state = None
+        return data_set
+
+    def has_detail_stats(self) -> bool:
+        """Проверяет, можно ли получить детальную статистику: в потоковом и параллельном режимах вакансии
+        не хранятся.
+
+        :return: True, если detail_stats доступен.
+        """
+        return (self.columns is not None or self.cube is not None or self.__state is not None
+                or bool(self.__list_vacs))
+
+    def detail_stats(self) -> Iterator[Tuple[int, str, str, int, int]]:
+        """Перебирает статистику по каждой тройке (год, город, название вакансии) без ограничения количества.
+
+        Доступно в обычном и колоночном режимах, с кэшем, с кубом и для набора из накопленного состояния.
+
+        :return: Итератор по кортежам (год, город, название, средняя ЗП, количество вакансий).
+        """
+        if not self.has_detail_stats():
+            raise Exception('Детальная статистика недоступна в потоковом и параллельном режимах')
+        if self.columns is not None:
+            stats = self.columns.group_by_year_city_name()
+        elif self.cube is not None:
+            stats = ((*key, salary_sum, count)
+                     for key, (salary_sum, count) in self.cube.roll_up('year', 'city', 'name').items())
+        else:
+            state = self.__state
+            if state is None:
+                state = AggregateState()
+                state.add(self.__list_vacs)
+            stats = ((*key, salary_sum, count) for key, (salary_sum, count) in state.stats.items())
+        return ((year, city, name, int(salary_sum / count), count) for year, city, name, salary_sum, count in stats)
+
+    def has_distributions(self) -> bool:
+        """Проверяет, велись ли распределения ЗП (см. параметр distributions конструктора).
+
+        :return: True, если распределения доступны.
+        """
+        return bool(self.distribution_by_year)
+
+    def quantiles_by_year(self) -> Dict[int, List[int]]:
+        """Квантили ЗП уровней quantile_levels по годам.
+
+        :return: Словарь {год: [квантили]}.
+        """
+        return {year: [int(self.distribution_by_year[year].quantile(level)) for level in self.quantile_levels]
+                for year in self.years if year in self.distribution_by_year}
+
+    def quantiles_by_city(self) -> Dict[str, List[int]]:
+        """Квантили ЗП уровней quantile_levels по городам из cities_by_salary.
+
+        :return: Словарь {город: [квантили]}.
+        """
+        return {city: [int(self.distribution_by_city[city].quantile(level)) for level in self.quantile_levels]
+                for city in self.cities_by_salary if city in self.distribution_by_city}
+
+    def histogram_by_year(self, share: float = 0.99) -> Tuple[List[int], Dict[int, List[int]]]:
+        """Гистограммы ЗП по годам с общими корзинами шириной SalaryDistribution.bin_width.
 
-    def count_by_years(self, _dict: Dict[int, List[Vacancy]]) -> Dict[int, int]:
-        """Группирует количество вакансий по годам.
+        Корзины идут до квантиля share всех ЗП, последняя корзина включает все большие ЗП.
 
-        :param _dict: Словарь {год: массив вакансий}.
-        :return: Словарь {год: количество вакансий}.
+        :param share: Доля ЗП, покрываемая корзинами до последней.
+        :return: Tuple из массива нижних границ корзин и словаря {год: количества по корзинам}.
         """
-        count_by_years_dict = {}
-        for year in self.years:
-            count_by_years_dict[year] = len(_dict[year]) if _dict.keys().__contains__(year) else 0
-        return count_by_years_dict
+        total = SalaryDistribution()
+        for distribution in self.distribution_by_year.values():
+            total.merge(distribution)
+        count_bins = int(total.quantile(share) // SalaryDistribution.bin_width) + 2
+        return ([index * SalaryDistribution.bin_width for index in range(count_bins)],
+                {year: self.distribution_by_year[year].histogram(count_bins)
+                 for year in self.years if year in self.distribution_by_year})
+
+    quantile_levels = (0.25, 0.5, 0.75, 0.9)
+
+    @staticmethod
+    def read_vacancies(file_name: str, rates: CurrencyRates = None) -> Iterator[Vacancy]:
+        """Потоково читает вакансии из csv файла.
+
+        :param file_name: Имя файла.
+        :param rates: Курсы валют по периодам.
+        :return: Итератор по вакансиям, прошедшим фильтр.
+        """
+        return (Vacancy.from_record(record, rates) for record in DataSet.read_records(file_name))
+
+    @staticmethod
+    def read_records(file_name: str) -> Iterator[Tuple[str, ...]]:
+        """Потоково читает и проверяет записи csv файла по схеме RecordSchema через MappedCsvReader.
+
+        :param file_name: Имя файла.
+        :return: Итератор по записям в порядке RecordSchema.fields.
+        """
+        reader = MappedCsvReader(file_name)
+        return reader.records(RecordSchema(reader.headers))
+
+    def __parallel_stats(self, file_name: str, prof_name: str, processes: int, professions: List[str],
+                         rates: CurrencyRates, distributions: bool = False,
+                         years: Tuple[int, int] = None) -> Tuple[SalaryAggregator, Tuple[int, Dict]]:
+        """Разбирает файл по частям в нескольких процессах и объединяет их статистику.
+
+        Части объединяются в порядке следования в файле, поэтому порядок годов и городов
+        совпадает с последовательным разбором. Для папки разбиения на части делятся файлы нужных годов,
+        они объединяются в порядке первого появления годов. Заголовки проверяются схемой до деления на части,
+        чтобы в файле без данных отсутствие столбцов было ошибкой, как в остальных режимах.
+
+        :param file_name: Имя файла или папки разбиения.
+        :param prof_name: Название профессии.
+        :param processes: Количество процессов.
+        :param professions: Дополнительные профессии.
+        :param rates: Курсы валют по периодам.
+        :param distributions: Вести распределения ЗП по годам и городам.
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все годы.
+        :return: Подсчёт с объединёнными суммами, количествами и распределениями частей и счётчики строк,
+            как у parse_chunk.
+        """
+        encoding = locale.getpreferredencoding(False)
+        rejects = {}
+        if YearPartitions.is_partitioned(file_name):
+            partitions = YearPartitions(file_name)
+            readers = [MappedCsvReader(name, encoding) for name in partitions.files(years)]
+            headers, years = partitions.headers, None
+            rejects.update(partitions.rejects)
+        else:
+            readers = [MappedCsvReader(file_name, encoding)]
+            headers = readers[0].headers
+        RecordSchema(headers)
+        sizes = [os.path.getsize(reader.file_name) - reader.start for reader in readers]
+        chunk_size = 64 << 20
+        count_chunks = max(processes * 4, sum(sizes) // chunk_size)
+        chunks = [(reader.file_name, bounds) for reader, size in zip(readers, sizes)
+                  for bounds in self.__chunk_bounds(reader.file_name, reader.start,
+                                                    max(1, count_chunks * size // max(sum(sizes), 1)))]
+
+        merged = SalaryAggregator(prof_name, professions, distributions)
+        accepted = 0
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            parts = executor.map(DataSet.parse_chunk, [name for name, _ in chunks], [bounds for _, bounds in chunks],
+                                 itertools.repeat(encoding), itertools.repeat(headers), itertools.repeat(prof_name),
+                                 itertools.repeat(professions), itertools.repeat(rates),
+                                 itertools.repeat(distributions), itertools.repeat(years))
+            for part in parts:
+                merged.merge(part[:4])
+                merged.merge_distributions(*part[5])
+                accepted += part[4][0]
+                for reason, count in part[4][1].items():
+                    rejects[reason] = rejects.get(reason, 0) + count
+        return merged, (accepted, rejects)
+
+    @staticmethod
+    def __chunk_bounds(file_name: str, start: int, count_chunks: int) -> List[Tuple[int, int]]:
+        """Делит файл на диапазоны байт, границы которых совпадают с границами записей.
+
+        Границы ищутся MappedCsvReader.record_ends с отслеживанием полей в кавычках, как у модуля csv.
+        Если после желаемой границы до следующей нет конца записи, части объединяются, и их выходит меньше.
+
+        :param file_name: Имя файла.
+        :param start: Смещение начала данных (после заголовков).
+        :param count_chunks: Желаемое количество частей.
+        :return: Список диапазонов (начало, конец).
+        """
+        size = os.path.getsize(file_name)
+        if size <= start:
+            return []
+        targets = [start + (size - start) * i // count_chunks for i in range(1, count_chunks)]
+        with open(file_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            cuts = [start] + MappedCsvReader.record_ends(buffer, start, size, targets) + [size]
+        return [(begin, end) for begin, end in zip(cuts, cuts[1:]) if begin < end]
+
+    @staticmethod
+    def parse_chunk(file_name: str, bounds: Tuple[int, int], encoding: str, headers: List[str],
+                    prof_name: str, professions: List[str] = (), rates: CurrencyRates = None,
+                    distributions: bool = False,
+                    years: Tuple[int, int] = None) -> Tuple[Dict, Dict, Dict, List[Dict], Tuple[int, Dict], Tuple]:
+        """Разбирает часть файла и считает по ней суммы и количества ЗП. Выполняется в дочернем процессе.
+
+        :param file_name: Имя файла.
+        :param bounds: Диапазон байт (начало, конец), выровненный по границам записей.
+        :param encoding: Кодировка файла.
+        :param headers: Массив заголовков.
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии.
+        :param rates: Курсы валют по периодам.
+        :param distributions: Вести распределения ЗП по годам и городам.
+        :param years: Диапазон годов (первый, последний) включительно, по умолчанию - все годы.
+        :return: Словари сумм и количеств, как у SalaryAggregator.result, Tuple из количества принятых строк
+            и словаря отброшенных строк по причинам и Tuple из распределений ЗП по годам и по городам.
+        """
+        schema = RecordSchema(headers)
+        aggregator = SalaryAggregator(prof_name, professions, distributions).add(
+            Vacancy.from_record(record, rates)
+            for record in DataSet.select_years(MappedCsvReader(file_name, encoding).records(schema, bounds), years))
+        return (*aggregator.result(), (schema.accepted, schema.rejects),
+                (aggregator.distribution_by_year, aggregator.distribution_by_city))
+
+    def __apply_columns_stats(self, prof_name: str, professions: List[str]):
+        """Заполняет итоговые словари векторно по колоночному хранилищу self.columns.
+
+        :param prof_name: Название профессии.
+        :param professions: Дополнительные профессии.
+        """
+        self.__apply_stats(prof_name, self.columns.group_by_year(),
+                           self.columns.group_by_year(self.__profession_rows(prof_name)),
+                           self.columns.group_by_city())
+        if professions:
+            self.__apply_professions(professions, self.columns.group_by_year_professions(
+                AhoCorasick(professions), len(professions)))
+
+    def __apply_professions(self, professions: List[str], by_profession: List[Dict[int, Tuple[float, int]]]):
+        """Заполняет self.professions из сумм и количеств ЗП по годам для каждой профессии.
+
+        :param professions: Дополнительные профессии.
+        :param by_profession: Массив словарей {год: (сумма ЗП, количество)}, по одному на профессию.
+        """
+        for prof_name, by_year in zip(professions, by_profession):
+            self.professions[prof_name] = self.__year_dicts(by_year)
+
+    def __year_dicts(self, by_year: Dict[int, Tuple[float, int]]) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """Переводит суммы и количества ЗП по годам в словари средней ЗП и количества по всем годам.
+
+        :param by_year: Словарь {год: (сумма ЗП, количество)}.
+        :return: Словари {год: средняя ЗП} и {год: количество вакансий}, для отсутствующих годов - 0.
+        """
+        return ({year: int(by_year[year][0] / by_year[year][1]) if year in by_year else 0 for year in self.years},
+                {year: by_year[year][1] if year in by_year else 0 for year in self.years})
+
+    def __apply_stats(self, prof_name: str, by_year: Dict[int, Tuple[float, int]],
+                      by_year_name: Dict[int, Tuple[float, int]], by_city: Dict[str, Tuple[float, int]]):
+        """Заполняет итоговые словари из накопленных сумм и количеств ЗП.
+
+        :param prof_name: Название профессии.
+        :param by_year: Словарь {год: (сумма ЗП, количество)}.
+        :param by_year_name: Словарь {год: (сумма ЗП, количество)} для выбранной профессии.
+        :param by_city: Словарь {город: (сумма ЗП, количество)}.
+        """
+        self.prof_name = prof_name
+        self.years = list(by_year.keys())
+        self.salary_by_year_dict = {year: int(by_year[year][0] / by_year[year][1]) for year in self.years}
+        self.count_by_year_dict = {year: by_year[year][1] for year in self.years}
+        self.salary_by_year_name_dict, self.count_by_year_name_dict = self.__year_dicts(by_year_name)
+
+        count_first_cities = 10
+        total = sum(stat[1] for stat in by_city.values())
+        salary_by_city = {}
+        fraction_by_city = {}
+        for city, (salary_sum, count) in by_city.items():
+            fraction = count / total
+            if fraction * 100 >= 1:
+                salary_by_city[city] = int(salary_sum / count)
+                fraction_by_city[city] = round(fraction, 4)
+        self.salary_by_all_cities_dict = dict(sorted(salary_by_city.items(), key=lambda x: x[1], reverse=True))
+        self.percent_by_all_cities_dict = dict(sorted(fraction_by_city.items(), key=lambda x: x[1], reverse=True))
+        self.salary_by_city_dict = dict(itertools.islice(self.salary_by_all_cities_dict.items(), count_first_cities))
+        self.percent_by_city_dict = dict(itertools.islice(self.percent_by_all_cities_dict.items(), count_first_cities))
+        self.cities_by_salary = list(self.salary_by_city_dict.keys())
+        self.cities_by_percent = list(self.percent_by_city_dict.keys())
+
+    @staticmethod
+    def clean_text(text: str) -> str:
+        """Очищает текст от лишних символов.
+
+        :param text: Сырой текст.
+        :return: Чистый текст.
+        """
+        cleaned_text = re.sub(re.compile('<.*?>'), '', text).strip()
+        return ';'.join(cleaned_text.split('\n')) if '\n' in cleaned_text else ' '.join(cleaned_text.split())
 
     def print(self):
         """Выводит в консоль всю обработанную информацию.
@@ -217,35 +2674,45 @@ class DataSet:
 class ReportGraphic:
     """Класс для создания PNG картинки с графиками, исходя из данных ему данных.
 
+    Рисует через объектный интерфейс matplotlib и холст Agg без глобального состояния pyplot,
+    поэтому отчёты можно строить из нескольких потоков или процессов.
     """
 
-    def __init__(self, data_set: DataSet):
+    def __init__(self, data_set: DataSet, metrics: Metrics = None):
         """Инициализирует ReportGraphic.
 
         :param data_set: Готовые данные для вывода.
+        :param metrics: Сборщик метрик, по умолчанию метрики не собираются.
         """
         self.__data_set = data_set
+        self.metrics = metrics or Metrics(enabled=False)
 
-    def generate_image(self):
+    def generate_image(self, file_name: str = 'graph.png'):
         """Метод генерации итогового изображения.
 
+        :param file_name: Имя файла для сохранения.
         """
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(nrows=2, ncols=2)
-        self.generate_bar(ax=ax1,
-                          axis_x=self.__data_set.years,
-                          axes_y=[self.__data_set.salary_by_year_dict.values(),
-                                  self.__data_set.salary_by_year_name_dict.values()],
-                          title='Уровень зарплат по годам',
-                          labels=['Средняя з/п', f'з/п {self.__data_set.prof_name.lower()}'],
-                          width=0.4)
-        self.generate_bar(ax=ax2,
-                          axis_x=self.__data_set.years,
-                          axes_y=[self.__data_set.count_by_year_dict.values(),
-                                  self.__data_set.count_by_year_name_dict.values()],
-                          title='Количество вакансий по годам',
-                          labels=['Количество вакансий', f'Количество вакансий \n{self.__data_set.prof_name.lower()}'],
-                          width=0.4)
-        cities_by_salary = ['\n'.join(re.split(r'-| ', city_name)) for city_name in self.__data_set.cities_by_salary]
+        fig = mpl_figure.Figure()
+        mpl_agg.FigureCanvasAgg(fig)
+        with self.metrics.stage('image_draw'):
+            self.draw(fig)
+        with self.metrics.stage('image_layout'):
+            fig.tight_layout()
+        with self.metrics.stage('image_save'):
+            fig.savefig(file_name)
+            fig.clear()
+
+    def draw(self, fig: mpl_figure.Figure):
+        """Рисует четыре графика на пустой фигуре.
+
+        :param fig: Фигура matplotlib.
+        """
+        ((ax1, ax2), (ax3, ax4)) = fig.subplots(nrows=2, ncols=2)
+        for ax, (axes_y, title, labels) in zip((ax1, ax2), self.bar_series()):
+            self.generate_bar(ax=ax, axis_x=self.__data_set.years, axes_y=axes_y, title=title, labels=labels,
+                              width=0.4)
+        cities_by_salary = ['\n'.join(re.split(r'-| ', city_name))
+                            for city_name in self.__data_set.cities_by_salary]
         self.generate_barh(ax=ax3,
                            axis_x=cities_by_salary,
                            axes_y=list(self.__data_set.salary_by_city_dict.values()),
@@ -255,8 +2722,99 @@ class ReportGraphic:
                           labels=self.__data_set.cities_by_percent,
                           title='Доля вакансий по городам')
 
-        plt.tight_layout()
-        plt.savefig('graph.png')
+    def generate_distribution_image(self, file_name: str = 'distribution.png'):
+        """Генерирует изображение с распределением ЗП: квантили по годам и гистограмма всех ЗП.
+
+        Требует набора данных с распределениями (см. параметр distributions DataSet).
+
+        :param file_name: Имя файла для сохранения.
+        """
+        if not self.__data_set.has_distributions():
+            raise Exception('Распределения ЗП не велись: создайте DataSet с distributions=True')
+        fig = mpl_figure.Figure(figsize=(9.6, 4.8))
+        mpl_agg.FigureCanvasAgg(fig)
+        with self.metrics.stage('image_draw'):
+            self.draw_distributions(fig)
+        with self.metrics.stage('image_layout'):
+            fig.tight_layout()
+        with self.metrics.stage('image_save'):
+            fig.savefig(file_name)
+            fig.clear()
+
+    def draw_distributions(self, fig: mpl_figure.Figure):
+        """Рисует квантили ЗП по годам и гистограмму ЗП за все годы на пустой фигуре.
+
+        :param fig: Фигура matplotlib.
+        """
+        data_set = self.__data_set
+        fontsize = 8
+        ax1, ax2 = fig.subplots(nrows=1, ncols=2)
+        quantiles = data_set.quantiles_by_year()
+        years = list(quantiles)
+        for index, level in enumerate(data_set.quantile_levels):
+            ax1.plot(years, [values[index] for values in quantiles.values()], marker='o', markersize=3,
+                     label=f'P{round(level * 100)}')
+        ax1.set_title('Квантили зарплат по годам')
+        ax1.set_xticks(years)
+        ax1.set_xticklabels(years, rotation=90, fontsize=fontsize)
+        ax1.grid(axis='y')
+        ax1.legend(fontsize=fontsize)
+
+        starts, histograms = data_set.histogram_by_year()
+        counts = [sum(column) for column in zip(*histograms.values())]
+        ax2.bar(starts, counts, width=SalaryDistribution.bin_width, align='edge')
+        ax2.set_title('Распределение зарплат')
+        ax2.set_xlabel(f'з/п, шаг {SalaryDistribution.bin_width}, последний столбец - выше', fontsize=fontsize)
+        ax2.tick_params(labelsize=fontsize)
+        ax2.grid(axis='y')
+
+    def bar_series(self) -> List[Tuple[List, str, List[str]]]:
+        """Описывает два графика по годам.
+
+        :return: Массив кортежей (данные для оси Y, заголовок, подписи рядов).
+        """
+        data_set = self.__data_set
+        return [([data_set.salary_by_year_dict.values(), data_set.salary_by_year_name_dict.values()],
+                 'Уровень зарплат по годам',
+                 ['Средняя з/п', f'з/п {data_set.prof_name.lower()}']),
+                ([data_set.count_by_year_dict.values(), data_set.count_by_year_name_dict.values()],
+                 'Количество вакансий по годам',
+                 ['Количество вакансий', f'Количество вакансий \n{data_set.prof_name.lower()}'])]
+
+    @staticmethod
+    def render_batch(jobs: List[Tuple[DataSet, str]]) -> List[str]:
+        """Строит изображения для части заданий на одной заготовке фигуры. Используется как задача
+        для пула процессов.
+
+        :param jobs: Пары (набор данных, имя файла).
+        :return: Имена сохранённых файлов.
+        """
+        template = ChartTemplate()
+        try:
+            return [template.render(data_set, file_name) for data_set, file_name in jobs]
+        finally:
+            template.close()
+
+    @classmethod
+    def render_many(cls, jobs: Iterable[Tuple[DataSet, str]], processes: int = 1) -> List[str]:
+        """Строит изображения для многих наборов данных, например по одному на профессию.
+
+        Каждый процесс получает непрерывную часть заданий и переиспользует для них одну заготовку фигуры
+        (см. ChartTemplate). В процессы передаются только итоговые словари наборов (см. DataSet.summary).
+
+        :param jobs: Пары (набор данных, имя файла).
+        :param processes: Количество процессов, при значении 1 изображения строятся последовательно.
+        :return: Имена сохранённых файлов в порядке заданий.
+        """
+        jobs = list(jobs)
+        if processes <= 1 or len(jobs) <= 1:
+            return cls.render_batch(jobs)
+        processes = min(processes, len(jobs))
+        size = -(-len(jobs) // processes)
+        batches = [[(data_set.summary(), file_name) for data_set, file_name in jobs[start:start + size]]
+                   for start in range(0, len(jobs), size)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            return list(itertools.chain.from_iterable(executor.map(cls.render_batch, batches)))
 
     def generate_bar(self, ax, axis_x: List[int], axes_y: List[List[int]], title: str, labels: List[str],
                      width: float):
@@ -314,59 +2872,329 @@ class ReportGraphic:
         ax.grid(axis='x')
 
 
+class ChartTemplate:
+    """Заготовка изображения ReportGraphic для серий однотипных отчётов, например по одному на профессию.
+
+    Фигура, оси, шрифты и раскладка создаются при первом отчёте. Для следующих отчётов с теми же годами
+    и городами меняются только высоты столбцов, секторы круговой диаграммы и подписи легенды, после чего
+    изображение сохраняется без повторного tight_layout (раскладка пересчитывается, только если сдвинулись
+    подписи круговой диаграммы). Если годы или города другие, заготовка строится заново.
+    """
+
+    def __init__(self, metrics: Metrics = None):
+        """Инициализирует пустую заготовку.
+
+        :param metrics: Сборщик метрик, по умолчанию метрики не собираются.
+        """
+        self.figure = None
+        self.metrics = metrics or Metrics(enabled=False)
+        self.__key = None
+        self.__pie = None
+
+    def render(self, data_set: DataSet, file_name: str) -> str:
+        """Строит изображение для набора данных, по возможности обновляя готовую фигуру.
+
+        :param data_set: Готовые данные для вывода.
+        :param file_name: Имя файла для сохранения.
+        :return: Имя сохранённого файла.
+        """
+        key = (tuple(data_set.years), tuple(data_set.cities_by_salary), tuple(data_set.cities_by_percent))
+        if key != self.__key:
+            self.close()
+            self.figure = mpl_figure.Figure()
+            mpl_agg.FigureCanvasAgg(self.figure)
+            with self.metrics.stage('image_draw'):
+                ReportGraphic(data_set).draw(self.figure)
+            with self.metrics.stage('image_layout'):
+                self.figure.tight_layout()
+            self.__key = key
+            self.__pie = list(data_set.percent_by_city_dict.values())
+        else:
+            with self.metrics.stage('image_update'):
+                self.__update(data_set)
+        with self.metrics.stage('image_save'):
+            self.figure.savefig(file_name)
+        return file_name
+
+    def close(self):
+        """Освобождает фигуру.
+
+        """
+        if self.figure is not None:
+            self.figure.clear()
+        self.figure = None
+        self.__key = None
+        self.__pie = None
+
+    def __update(self, data_set: DataSet):
+        """Переносит данные нового набора в artists готовой фигуры.
+
+        :param data_set: Готовые данные для вывода.
+        """
+        ax1, ax2, ax3, ax4 = self.figure.axes
+        for ax, (axes_y, _, labels) in zip((ax1, ax2), ReportGraphic(data_set).bar_series()):
+            for container, values in zip(ax.containers, axes_y):
+                for rect, value in zip(container.patches, values):
+                    rect.set_height(value)
+            for text, label in zip(ax.get_legend().get_texts(), labels):
+                text.set_text(label)
+            ax.relim()
+            ax.autoscale_view()
+        for rect, value in zip(ax3.containers[0].patches, data_set.salary_by_city_dict.values()):
+            rect.set_width(value)
+        ax3.relim()
+        ax3.autoscale_view()
+        pie = list(data_set.percent_by_city_dict.values())
+        if pie != self.__pie:
+            self.__update_pie(ax4, pie)
+            self.figure.tight_layout()
+            self.__pie = pie
+
+    @staticmethod
+    def __update_pie(ax, date: List[float]):
+        """Пересчитывает углы секторов и положения подписей круговой диаграммы так же, как Axes.pie
+        с параметрами по умолчанию.
+
+        :param ax: Часть холста с круговой диаграммой.
+        :param date: Доли секторов.
+        """
+        label_distance = 1.1
+        total = sum(date)
+        theta1 = 0
+        for wedge, text, value in zip(ax.patches, ax.texts, date):
+            theta2 = theta1 + value / total
+            wedge.set_theta1(360 * theta1)
+            wedge.set_theta2(360 * theta2)
+            thetam = np.pi * (theta1 + theta2)
+            x, y = label_distance * np.cos(thetam), label_distance * np.sin(thetam)
+            text.set_position((x, y))
+            text.set_horizontalalignment('left' if x > 0 else 'right')
+            theta1 = theta2
+
+
 class ReportTable:
     """Генерирует EXCEL таблицу из данных класса DataSet"""
 
-    def __init__(self, data_set: DataSet):
+    header_style = 'report_header'
+    cell_style = 'report_cell'
+
+    def __init__(self, data_set: DataSet, metrics: Metrics = None):
         """Инициализирует объект ReportTable.
 
         :param data_set: Готовые данные для вывода.
+        :param metrics: Сборщик метрик, по умолчанию метрики не собираются.
         """
         self.__data_set = data_set
+        self.metrics = metrics or Metrics(enabled=False)
 
-    def generate_excel(self):
+    def generate_excel(self, file_name: str = 'report.xlsx', write_only: bool = False):
         """Генерирует EXCEL табличку.
 
+        :param file_name: Имя файла для сохранения.
+        :param write_only: Потоковая запись: строки добавляются в лист целиком с готовыми стилями,
+            ячейки не хранятся в памяти. Подходит для листов с большим количеством строк.
+        """
+        sheets = self.__summary_sheets()
+        if write_only:
+            wb = xl_workbook.Workbook(write_only=True)
+            with self.metrics.stage('excel_write'):
+                for title, header, x, count_row in sheets:
+                    self.write_sheet(wb, title, header, map(x, range(count_row)))
+        else:
+            wb = xl_workbook.Workbook()
+            worksheets = [wb.active] + [wb.create_sheet(title) for title, *_ in sheets[1:]]
+            worksheets[0].title = sheets[0][0]
+            with self.metrics.stage('excel_fill'):
+                for ws, (_, header, x, count_row) in zip(worksheets, sheets):
+                    self.__fill_sheet(header, x, ws, count_row)
+            with self.metrics.stage('excel_styles'):
+                for ws in reversed(worksheets):
+                    self.__apply_styles(ws)
+            self.metrics.count('excel_rows', sum(count_row for *_, count_row in sheets))
+
+        with self.metrics.stage('excel_save'):
+            wb.save(file_name)
+
+    def generate_full_excel(self, file_name: str = 'report_full.xlsx',
+                            progress: Callable[[str, int, int], None] = None):
+        """Генерирует полную EXCEL таблицу: к двум листам обычного отчёта добавляются все города
+        с долей вакансий от 1% и статистика по каждой тройке (год, город, название вакансии).
+
+        Листы пишутся потоково, как при write_only, поэтому память не зависит от количества строк.
+        Детальная статистика требует набора данных, хранящего вакансии (см. DataSet.detail_stats).
+
+        :param file_name: Имя файла для сохранения.
+        :param progress: Функция progress(лист, записано строк, всего строк), вызываемая по ходу записи.
         """
-        wb = Workbook()
-        by_year = wb.active
-        by_year.title = "Статистика по годам"
-        by_city = wb.create_sheet("Статистика по городам")
-
         data_set = self.__data_set
-        self.__fill_sheet(["Год", "Средняя зарплата", f"Средняя зарплата - {self.__data_set.prof_name}",
-                           "Количество вакансий", f"Количество вакансий - {self.__data_set.prof_name}"],
-                          lambda i: [data_set.years[i], data_set.salary_by_year_dict[data_set.years[i]],
-                                     data_set.salary_by_year_name_dict[data_set.years[i]],
-                                     data_set.count_by_year_dict[data_set.years[i]],
-                                     data_set.count_by_year_name_dict[data_set.years[i]]],
-                          by_year, len(data_set.years))
-
-        self.__fill_sheet(["Город", "Уровень зарплат", "",
-                           "Город", "Доля вакансий"], lambda i: [data_set.cities_by_salary[i],
-                                                                 data_set.salary_by_city_dict[
-                                                                     data_set.cities_by_salary[i]], '',
-                                                                 data_set.cities_by_percent[i],
-                                                                 data_set.percent_by_city_dict[
-                                                                     data_set.cities_by_percent[i]]], by_city,
-                          len(data_set.cities_by_salary))
-        self.__apply_styles(by_city)
-        self.__apply_styles(by_year)
-
-        wb.save('report.xlsx')
+        if not data_set.has_detail_stats():
+            raise Exception('Детальная статистика недоступна в потоковом и параллельном режимах')
+        cities_by_salary = list(data_set.salary_by_all_cities_dict.items())
+        cities_by_percent = list(data_set.percent_by_all_cities_dict.items())
+        wb = xl_workbook.Workbook(write_only=True)
+        with self.metrics.stage('excel_write'):
+            for title, header, x, count_row in self.__summary_sheets():
+                self.write_sheet(wb, title, header, map(x, range(count_row)), progress)
+            self.write_sheet(wb, "Все города", ["Город", "Уровень зарплат", "", "Город", "Доля вакансий"],
+                             ([*salary, '', *percent] for salary, percent in zip(cities_by_salary, cities_by_percent)),
+                             progress)
+            self.write_sheet(wb, "Год, город, профессия",
+                             ["Год", "Город", "Название вакансии", "Средняя зарплата", "Количество вакансий"],
+                             map(list, data_set.detail_stats()), progress)
+        with self.metrics.stage('excel_save'):
+            wb.save(file_name)
+
+    def __summary_sheets(self) -> List[Tuple[str, List[str], Callable[[int], List], int]]:
+        """Описывает листы обычного отчёта. Если в наборе данных велись распределения ЗП, к двум листам
+        добавляются квантили ЗП по годам и городам и гистограммы ЗП по годам.
+
+        :return: Массив кортежей (название листа, заголовки, функция строки по индексу, количество строк).
+        """
+        data_set = self.__data_set
+        sheets = [("Статистика по годам",
+                   ["Год", "Средняя зарплата", f"Средняя зарплата - {self.__data_set.prof_name}",
+                    "Количество вакансий", f"Количество вакансий - {self.__data_set.prof_name}"],
+                   lambda i: [data_set.years[i], data_set.salary_by_year_dict[data_set.years[i]],
+                              data_set.salary_by_year_name_dict[data_set.years[i]],
+                              data_set.count_by_year_dict[data_set.years[i]],
+                              data_set.count_by_year_name_dict[data_set.years[i]]],
+                   len(data_set.years)),
+                  ("Статистика по городам",
+                   ["Город", "Уровень зарплат", "", "Город", "Доля вакансий"],
+                   lambda i: [data_set.cities_by_salary[i],
+                              data_set.salary_by_city_dict[data_set.cities_by_salary[i]], '',
+                              data_set.cities_by_percent[i],
+                              data_set.percent_by_city_dict[data_set.cities_by_percent[i]]],
+                   len(data_set.cities_by_salary))]
+        if data_set.has_distributions():
+            levels = [f'P{round(level * 100)}' for level in data_set.quantile_levels]
+            by_year = list(data_set.quantiles_by_year().items())
+            by_city = list(data_set.quantiles_by_city().items())
+            starts, histograms = data_set.histogram_by_year()
+            sheets += [("Распределение по годам", ["Год", *levels], lambda i: [by_year[i][0], *by_year[i][1]],
+                        len(by_year)),
+                       ("Распределение по городам", ["Город", *levels], lambda i: [by_city[i][0], *by_city[i][1]],
+                        len(by_city)),
+                       ("Гистограмма ЗП", ["Зарплата от", "Зарплата до", *histograms],
+                        lambda i: [starts[i], starts[i + 1] if i + 1 < len(starts) else '',
+                                   *(counts[i] for counts in histograms.values())],
+                        len(starts))]
+        return sheets
+
+    def write_sheet(self, wb, title: str, header: List[str], rows: Iterable[List],
+                    progress: Callable[[str, int, int], None] = None):
+        """Потоково записывает лист в книгу, открытую в режиме write_only.
+
+        В таком режиме ширины столбцов нужно задать до первой строки, поэтому строки перебираются один раз
+        для подсчёта ширин и по пути пачками сбрасываются во временный файл, из которого затем пишутся в лист.
+        Строки не хранятся в памяти и не вычисляются повторно.
+
+        :param wb: Книга Workbook(write_only=True).
+        :param title: Название листа.
+        :param header: Заголовки для листа.
+        :param rows: Итератор по строкам данных.
+        :param progress: Функция progress(лист, записано строк, всего строк), вызываемая каждые
+            progress_step строк и после последней строки.
+        """
+        with tempfile.TemporaryFile() as spool:
+            widths, count_row = self.__spool_rows(rows, [len(str(value)) for value in header], spool)
+            spool.seek(0)
+            self.__write_rows(wb, title, header, widths, self.__spooled_rows(spool, count_row), count_row, progress)
+
+    spool_step = 10000
+
+    def __spool_rows(self, rows: Iterable[List], widths: List[int], spool) -> Tuple[List[int], int]:
+        """Считает ширины столбцов и сбрасывает строки пачками по spool_step во временный файл.
+
+        :param rows: Итератор по строкам данных.
+        :param widths: Ширины заголовков.
+        :param spool: Временный файл в двоичном режиме.
+        :return: Tuple из ширин столбцов и количества строк.
+        """
+        count_row = 0
+        batch = []
+        for row in rows:
+            count_row += 1
+            for index, value in enumerate(row):
+                widths[index] = max(widths[index], len(str(value)))
+            batch.append(row)
+            if len(batch) == self.spool_step:
+                pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+        return widths, count_row
+
+    @staticmethod
+    def __spooled_rows(spool, count_row: int) -> Iterator[List]:
+        """Читает строки, сброшенные __spool_rows.
+
+        :param spool: Временный файл, перемотанный в начало.
+        :param count_row: Количество строк.
+        :return: Итератор по строкам данных.
+        """
+        for _ in range(0, count_row, ReportTable.spool_step):
+            yield from pickle.load(spool)
+
+    def __write_rows(self, wb, title: str, header: List[str], widths: List[int], rows: Iterator[List],
+                     count_row: int, progress: Callable[[str, int, int], None] = None):
+        """Создаёт лист с заданными ширинами столбцов и записывает в него заголовки и строки.
+
+        :param wb: Книга Workbook(write_only=True).
+        :param title: Название листа.
+        :param header: Заголовки для листа.
+        :param widths: Ширины столбцов без отступа.
+        :param rows: Итератор по строкам данных.
+        :param count_row: Количество строк.
+        :param progress: Функция progress, как у write_sheet.
+        """
+        padding = 3
+        progress_step = 10000
+        ws = wb.create_sheet(title)
+        for index, width in enumerate(widths):
+            ws.column_dimensions[xl_utils.get_column_letter(index + 1)].width = width + padding
+
+        thin = xl_styles.Side(style='thin')
+        border = xl_styles.Border(left=thin, right=thin, top=thin, bottom=thin)
+        for name, font in ((self.header_style, xl_styles.Font(bold=True)), (self.cell_style, xl_styles.Font())):
+            if name not in wb.named_styles:
+                wb.add_named_style(xl_styles.NamedStyle(name=name, font=font, border=border))
+        ws.append([self.__styled_cell(ws, value, self.header_style) for value in header])
+        for written, row in enumerate(rows, 1):
+            ws.append([self.__styled_cell(ws, value, self.cell_style) for value in row])
+            if progress is not None and written % progress_step == 0:
+                progress(title, written, count_row)
+        if progress is not None:
+            progress(title, count_row, count_row)
+        self.metrics.count('excel_rows', count_row)
+
+    @staticmethod
+    def __styled_cell(ws, value, style: str):
+        """Создаёт ячейку для потоковой записи с именованным стилем книги.
+
+        Шрифт и рамка стиля регистрируются в книге один раз, ячейке назначается только имя стиля.
+
+        :param ws: Лист в режиме write_only.
+        :param value: Значение.
+        :param style: Имя стиля, добавленного в книгу.
+        :return: Ячейка WriteOnlyCell.
+        """
+        cell = xl_cell.WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
 
     def __apply_styles(self, ws):
         """Применяет стили для листа.
 
         :param ws: Лист таблицы.
         """
-        thin_border = Border(left=Side(style='thin'),
-                             right=Side(style='thin'),
-                             top=Side(style='thin'),
-                             bottom=Side(style='thin'))
+        thin_border = xl_styles.Border(left=xl_styles.Side(style='thin'),
+                                       right=xl_styles.Side(style='thin'),
+                                       top=xl_styles.Side(style='thin'),
+                                       bottom=xl_styles.Side(style='thin'))
 
         for cell in next(ws.rows):
-            cell.font = Font(bold=True)
+            cell.font = xl_styles.Font(bold=True)
         for column_cells in ws.columns:
             padding = 3
             length = max(len(str(cell.value)) for cell in column_cells)
@@ -394,15 +3222,227 @@ class ReportTable:
         :param ws: Лист таблицы.
         """
         for column_index in range(0, len(data)):
-            ws[get_column_letter(column_index + 1) + str(row_index)] = data[column_index]
-
-
-report_type = input('Вакансии или Статистика: ')
-file_name = input('Введите название файла: ')
-name = input('Введите название профессии: ')
-if report_type == 'Вакансии':
-    data = DataSet(file_name, name)
-    ReportTable(data).generate_excel()
-else:
-    data = DataSet(file_name, name)
-    ReportGraphic(data).generate_image()
+            ws[xl_utils.get_column_letter(column_index + 1) + str(row_index)] = data[column_index]
+
+
+class ReportJobs:
+    """Пакет заданий на отчёты: каждое задание - файл, профессия, тип отчёта и имя выходного файла.
+
+    Задания по одному файлу выполняются на одном разобранном наборе данных: все профессии файла
+    считаются за один проход, изображения строятся в пуле процессов на заготовке фигуры.
+    """
+    report_types = ('excel', 'image', 'full', 'distribution')
+    default_outputs = {'excel': 'report{suffix}.xlsx', 'image': 'graph{suffix}.png', 'full': 'report_full{suffix}.xlsx',
+                       'distribution': 'distribution{suffix}.png'}
+
+    def __init__(self, jobs: List[Dict[str, str]], processes: int = 1, cache_dir: str = None, rates_file: str = None,
+                 write_only: bool = False, metrics: Metrics = None, years: Tuple[int, int] = None):
+        """Инициализирует пакет заданий.
+
+        :param jobs: Задания - словари с ключами file, profession, report и необязательным output.
+            В output можно указать {profession} - название профессии, пригодное для имени файла.
+        :param processes: Количество процессов для разбора файла и построения изображений.
+        :param cache_dir: Папка дискового кэша колонок, по умолчанию кэш не используется.
+        :param rates_file: Файл курсов валют по периодам (см. CurrencyRates.load).
+        :param write_only: Писать обычные EXCEL отчёты потоково.
+        :param metrics: Сборщик метрик, по умолчанию метрики не собираются.
+        :param years: Диапазон годов (первый, последний) включительно для всех отчётов, по умолчанию - все годы.
+        """
+        for job in jobs:
+            if job.get('report') not in self.report_types:
+                raise Exception(f"Неизвестный тип отчёта: {job.get('report')}")
+            if not job.get('file') or not job.get('profession'):
+                raise Exception('В задании должны быть указаны file и profession')
+        self.jobs = jobs
+        self.processes = processes
+        self.cache_dir = cache_dir
+        self.rates_file = rates_file
+        self.write_only = write_only
+        self.metrics = metrics or Metrics(enabled=False)
+        self.years = tuple(years) if years else None
+
+    @classmethod
+    def load(cls, file_name: str, **options) -> 'ReportJobs':
+        """Загружает пакет заданий из файла json или yaml.
+
+        Файл содержит список jobs и необязательные общие параметры: file (файл по умолчанию для заданий),
+        processes, cache, rates, write_only и years ([первый, последний]). Параметры из options имеют приоритет
+        над параметрами файла.
+
+        :param file_name: Имя файла заданий (.json, .yaml или .yml).
+        :param options: Параметры конструктора.
+        :return: Пакет заданий.
+        """
+        with open(file_name, encoding='utf-8') as file:
+            if os.path.splitext(file_name)[1].lower() in ('.yaml', '.yml'):
+                try:
+                    import yaml
+                except ImportError:
+                    raise Exception('Для файлов заданий в формате yaml нужен пакет PyYAML')
+                data = yaml.safe_load(file)
+            else:
+                data = json.load(file)
+        jobs = [{'file': data.get('file'), **job} for job in data['jobs']]
+        defaults = {'processes': data.get('processes', 1), 'cache_dir': data.get('cache'),
+                    'rates_file': data.get('rates'), 'write_only': data.get('write_only', False),
+                    'years': data.get('years')}
+        defaults.update({key: value for key, value in options.items() if value is not None})
+        return cls(jobs, **defaults)
+
+    @classmethod
+    def from_args(cls, file_name: str, professions: List[str], reports: List[str], outputs: Dict[str, str] = None,
+                  **options) -> 'ReportJobs':
+        """Составляет пакет заданий из аргументов командной строки: все отчёты для всех профессий.
+
+        :param file_name: Имя csv файла.
+        :param professions: Названия профессий.
+        :param reports: Типы отчётов.
+        :param outputs: Словарь {тип отчёта: имя файла}. При нескольких профессиях имя должно
+            содержать {profession}; по умолчанию - как в default_outputs.
+        :param options: Параметры конструктора.
+        :return: Пакет заданий.
+        """
+        outputs = outputs or {}
+        jobs = []
+        for report in reports:
+            output = outputs.get(report)
+            if output is None:
+                output = cls.default_outputs[report].format(suffix='' if len(professions) == 1 else '_{profession}')
+            elif len(professions) > 1 and '{profession}' not in output:
+                raise Exception(f'Для нескольких профессий имя файла {output} должно содержать {{profession}}')
+            jobs += [{'file': file_name, 'profession': profession, 'report': report, 'output': output}
+                     for profession in professions]
+        return cls(jobs, **options)
+
+    def run(self) -> List[str]:
+        """Выполняет задания, разбирая каждый файл один раз.
+
+        :return: Имена созданных файлов в порядке заданий.
+        """
+        rates = CurrencyRates.load(self.rates_file) if self.rates_file else None
+        by_file: Dict[str, List[Dict[str, str]]] = {}
+        for job in self.jobs:
+            by_file.setdefault(job['file'], []).append(job)
+        outputs = {}
+        for file_name, jobs in by_file.items():
+            data_set = self.__data_set(file_name, list(dict.fromkeys(job['profession'] for job in jobs)), rates)
+            images = []
+            for job in jobs:
+                output = self.output_name(job)
+                directory = os.path.dirname(output)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                profession_set = data_set.for_profession(job['profession'])
+                if job['report'] == 'excel':
+                    ReportTable(profession_set, self.metrics).generate_excel(output, self.write_only)
+                elif job['report'] == 'full':
+                    ReportTable(profession_set, self.metrics).generate_full_excel(output)
+                elif job['report'] == 'distribution':
+                    ReportGraphic(profession_set, self.metrics).generate_distribution_image(output)
+                else:
+                    images.append((profession_set, output))
+                outputs[id(job)] = output
+            with self.metrics.stage('images'):
+                ReportGraphic.render_many(images, self.processes)
+        return [outputs[id(job)] for job in self.jobs]
+
+    def __data_set(self, file_name: str, professions: List[str], rates: CurrencyRates) -> DataSet:
+        """Разбирает файл для всех профессий его заданий.
+
+        Полный отчёт требует хранения вакансий, поэтому с ним (или с кэшем) набор строится в колоночном
+        режиме, иначе - потоково или параллельно. Кэш не используется при отборе по годам и для папки
+        разбиения по годам. Для отчёта distribution ведутся распределения ЗП.
+
+        :param file_name: Имя csv файла, папки разбиения или колоночного файла.
+        :param professions: Профессии заданий.
+        :param rates: Курсы валют по периодам.
+        :return: Набор данных со статистикой по всем профессиям.
+        """
+        reports = {job['report'] for job in self.jobs if job['file'] == file_name}
+        options = {'distributions': 'distribution' in reports, 'years': self.years}
+        if self.cache_dir and self.years is None and not YearPartitions.is_partitioned(file_name):
+            options['cache'] = ColumnsCache(self.cache_dir)
+        elif 'full' in reports:
+            options['columnar'] = True
+        elif self.processes > 1:
+            options['processes'] = self.processes
+        else:
+            options['streaming'] = True
+        return DataSet(file_name, professions[0], professions=professions, rates=rates, metrics=self.metrics,
+                       **options)
+
+    @staticmethod
+    def output_name(job: Dict[str, str]) -> str:
+        """Имя выходного файла задания.
+
+        :param job: Задание.
+        :return: Имя файла, в котором {profession} заменено на название профессии, пригодное для имени файла.
+        """
+        suffix = re.sub(r'[^\w\-]+', '_', job['profession'])
+        output = job.get('output') or ReportJobs.default_outputs[job['report']].format(suffix='_{profession}')
+        return output.format(profession=suffix)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        parser = argparse.ArgumentParser(description='Отчёты по выгрузке вакансий: EXCEL таблицы и графики.')
+        parser.add_argument('file', nargs='?',
+                            help='csv файл с вакансиями, папка разбиения (--split) или колоночный файл (--convert)')
+        parser.add_argument('-p', '--profession', action='append', help='название профессии, можно указать несколько')
+        parser.add_argument('-r', '--report', nargs='+', choices=ReportJobs.report_types, default=['excel'],
+                            help='типы отчётов: excel - таблица, image - графики, full - полная таблица, '
+                                 'distribution - графики распределения зарплат')
+        parser.add_argument('--excel', help='имя файла таблицы, при нескольких профессиях - с {profession}')
+        parser.add_argument('--image', help='имя файла графиков, при нескольких профессиях - с {profession}')
+        parser.add_argument('--full', help='имя файла полной таблицы, при нескольких профессиях - с {profession}')
+        parser.add_argument('--distribution',
+                            help='имя файла графиков распределения, при нескольких профессиях - с {profession}')
+        parser.add_argument('-j', '--jobs', help='файл заданий json или yaml вместо file и --profession')
+        parser.add_argument('--processes', type=int, help='количество процессов')
+        parser.add_argument('--cache', help='папка дискового кэша колонок')
+        parser.add_argument('--rates', help='csv файл курсов валют по периодам')
+        parser.add_argument('--write-only', action='store_true', default=None, help='потоковая запись таблиц')
+        parser.add_argument('--metrics', action='store_true', help='писать метрики стадий в лог')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='с --metrics замерять пик памяти каждой стадии через tracemalloc (медленнее)')
+        parser.add_argument('--convert', metavar='OUTPUT',
+                            help='преобразовать csv файл file в сжатый колоночный файл OUTPUT (с курсами --rates)')
+        parser.add_argument('--split', metavar='DIRECTORY', help='разбить csv файл file на файлы по годам в DIRECTORY')
+        parser.add_argument('--years', nargs=2, type=int, metavar=('FIRST', 'LAST'),
+                            help='учитывать только вакансии этих годов включительно')
+        args = parser.parse_args()
+        if args.metrics:
+            logging.basicConfig(level=logging.INFO, format='%(message)s')
+        metrics = Metrics(log=True, trace_memory=args.trace_memory) if args.metrics else None
+        options = {'processes': args.processes, 'cache_dir': args.cache, 'rates_file': args.rates,
+                   'write_only': args.write_only, 'metrics': metrics, 'years': args.years}
+        try:
+            if args.convert or args.split:
+                if not args.file:
+                    parser.error('для --convert и --split нужно указать file')
+                if args.split:
+                    YearPartitions.split(args.file, args.split)
+                    print(args.split)
+                if args.convert:
+                    VacancyFile.convert(args.file, args.convert, CurrencyRates.load(args.rates) if args.rates else None)
+                    print(args.convert)
+                sys.exit()
+            if args.jobs:
+                report_jobs = ReportJobs.load(args.jobs, **options)
+            elif args.file and args.profession:
+                report_jobs = ReportJobs.from_args(
+                    args.file, args.profession, args.report,
+                    {report: getattr(args, report) for report in ReportJobs.report_types if getattr(args, report)},
+                    **{key: value for key, value in options.items() if value is not None})
+            else:
+                parser.error('нужно указать file и --profession или --jobs')
+            for output in report_jobs.run():
+                print(output)
+        except Exception as error:
+            parser.exit(1, f'{error}\n')
+    else:
+        report_type = input('Вакансии или Статистика: ')
+        file_name = input('Введите название файла: ')
+        name = input('Введите название профессии (несколько - через ";"): ')
+        names = [prof_name.strip() for prof_name in name.split(';')]
+        ReportJobs.from_args(file_name, names, ['excel' if report_type == 'Вакансии' else 'image']).run()
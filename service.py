@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import collections
+import functools
+import io
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Optional
+from urllib.parse import urlsplit, parse_qs
+
+from main import DataSet, ReportTable, ReportGraphic, ColumnsCache, CurrencyRates
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """LRU кэш готовых ответов, ограниченный количеством записей и суммарным размером."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 << 20):
+        """Инициализирует пустой кэш.
+
+        :param max_entries: Максимальное количество записей.
+        :param max_bytes: Максимальный суммарный размер ответов в байтах.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries: 'collections.OrderedDict[Tuple, Tuple[str, bytes]]' = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Tuple) -> Optional[Tuple[str, bytes]]:
+        """Возвращает ответ из кэша и отмечает его как недавно использованный.
+
+        :param key: Ключ запроса.
+        :return: Tuple из типа содержимого и тела ответа или None.
+        """
+        result = self.__entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return result
+
+    def put(self, key: Tuple, result: Tuple[str, bytes]):
+        """Добавляет ответ в кэш, вытесняя давно не использованные. Ответ больше лимита не кэшируется.
+
+        :param key: Ключ запроса.
+        :param result: Tuple из типа содержимого и тела ответа.
+        """
+        if len(result[1]) > self.max_bytes:
+            return
+        if key in self.__entries:
+            self.size -= len(self.__entries.pop(key)[1])
+        self.__entries[key] = result
+        self.size += len(result[1])
+        while len(self.__entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, body) = self.__entries.popitem(last=False)
+            self.size -= len(body)
+
+
+class ReportService:
+    """Сервис отчётов: выгрузка разбирается один раз, колонки остаются в памяти, а запросы
+    статистики по профессии, городу и годам считаются по ним без чтения csv.
+
+    Запросы (GET, параметры profession, city, years=ГГГГ-ГГГГ):
+        /stats - статистика в json;
+        /report.xlsx - EXCEL отчёт;
+        /graph.png - изображение с графиками;
+        /health - размер выгрузки и состояние кэша.
+
+    Подсчёт выполняется в пуле потоков, одинаковые одновременные запросы считаются один раз,
+    готовые ответы хранятся в LRU кэше.
+    """
+    content_types = {'stats': 'application/json; charset=utf-8',
+                     'report.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                     'graph.png': 'image/png'}
+
+    def __init__(self, data_set: DataSet, cache: ResultCache = None, workers: int = None):
+        """Инициализирует сервис.
+
+        :param data_set: Набор данных в колоночном режиме.
+        :param cache: Кэш ответов, по умолчанию - ResultCache с параметрами по умолчанию.
+        :param workers: Количество потоков для подсчёта и построения отчётов.
+        """
+        if data_set.columns is None:
+            raise Exception('Сервису нужен набор данных в колоночном режиме')
+        self.data_set = data_set
+        self.cache = cache or ResultCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.__pending: Dict[Tuple, asyncio.Future] = {}
+
+    @staticmethod
+    def parse_query(query: Dict[str, list]) -> Tuple[str, Optional[str], Optional[Tuple[int, int]]]:
+        """Разбирает параметры запроса.
+
+        :param query: Параметры из parse_qs.
+        :return: Tuple из профессии, города и диапазона лет.
+        """
+        if 'profession' not in query:
+            raise ValueError('не указан параметр profession')
+        prof_name = query['profession'][0]
+        city = query['city'][0] if 'city' in query else None
+        years = None
+        if 'years' in query:
+            first, _, last = query['years'][0].partition('-')
+            years = (int(first), int(last or first))
+        return prof_name, city, years
+
+    def build(self, kind: str, prof_name: str, city: Optional[str], years: Optional[Tuple[int, int]]) -> bytes:
+        """Считает статистику и строит ответ нужного вида. Выполняется в пуле потоков.
+
+        :param kind: Вид ответа: stats, report.xlsx или graph.png.
+        :param prof_name: Название профессии.
+        :param city: Город или None.
+        :param years: Диапазон лет или None.
+        :return: Тело ответа.
+        """
+        data_set = self.data_set.query(prof_name, city, years)
+        if kind == 'stats':
+            return json.dumps({'profession': prof_name, 'city': city, 'years': years,
+                               'salary_by_year': data_set.salary_by_year_dict,
+                               'count_by_year': data_set.count_by_year_dict,
+                               'salary_by_year_name': data_set.salary_by_year_name_dict,
+                               'count_by_year_name': data_set.count_by_year_name_dict,
+                               'salary_by_city': data_set.salary_by_city_dict,
+                               'percent_by_city': data_set.percent_by_city_dict}, ensure_ascii=False).encode()
+        if not data_set.years:
+            raise LookupError('нет вакансий для запроса')
+        output = io.BytesIO()
+        if kind == 'report.xlsx':
+            ReportTable(data_set).generate_excel(output, write_only=True)
+        else:
+            ReportGraphic(data_set).generate_image(output)
+        return output.getvalue()
+
+    async def respond(self, kind: str, query: Dict[str, list]) -> Tuple[str, bytes]:
+        """Возвращает ответ из кэша или строит его, объединяя одинаковые одновременные запросы.
+
+        :param kind: Вид ответа.
+        :param query: Параметры из parse_qs.
+        :return: Tuple из типа содержимого и тела ответа.
+        """
+        key = (kind, *self.parse_query(query))
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        pending = self.__pending.get(key)
+        if pending is None:
+            pending = asyncio.get_running_loop().run_in_executor(self.executor, self.build, *key)
+            pending.add_done_callback(functools.partial(self.__finish, key))
+            self.__pending[key] = pending
+        return self.content_types[kind], await asyncio.shield(pending)
+
+    def __finish(self, key: Tuple, pending: asyncio.Future):
+        """Убирает выполненный запрос из ожидающих и кэширует удачный ответ.
+
+        :param key: Ключ запроса.
+        :param pending: Future с телом ответа.
+        """
+        del self.__pending[key]
+        if not pending.cancelled() and pending.exception() is None:
+            self.cache.put(key, (self.content_types[key[0]], pending.result()))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуживает соединение HTTP/1.1 с поддержкой keep-alive.
+
+        :param reader: Поток чтения.
+        :param writer: Поток записи.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                method, target, version = request_line.decode('latin-1').split()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                status, content_type, body = await self.dispatch(method, target)
+                writer.write(f'{version} {status}\r\nContent-Type: {content_type}\r\n'
+                             f'Content-Length: {len(body)}\r\n'
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, target: str) -> Tuple[str, str, bytes]:
+        """Выбирает ответ по пути запроса.
+
+        :param method: Метод HTTP.
+        :param target: Путь с параметрами.
+        :return: Tuple из статуса, типа содержимого и тела ответа.
+        """
+        url = urlsplit(target)
+        kind = url.path.strip('/')
+        if method != 'GET':
+            return self.__error('405 Method Not Allowed', 'поддерживается только GET')
+        if kind == 'health':
+            return '200 OK', self.content_types['stats'], json.dumps(
+                {'rows': len(self.data_set.columns), 'cache_entries': len(self.cache), 'cache_bytes': self.cache.size,
+                 'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses}).encode()
+        if kind not in self.content_types:
+            return self.__error('404 Not Found', f'неизвестный путь {url.path}')
+        try:
+            return ('200 OK', *await self.respond(kind, parse_qs(url.query)))
+        except ValueError as error:
+            return self.__error('400 Bad Request', str(error))
+        except LookupError as error:
+            return self.__error('404 Not Found', str(error))
+        except Exception as error:
+            logger.exception('Ошибка при обработке %s', target)
+            return self.__error('500 Internal Server Error', str(error))
+
+    def __error(self, status: str, message: str) -> Tuple[str, str, bytes]:
+        """Формирует ответ с ошибкой.
+
+        :param status: Статус HTTP.
+        :param message: Текст ошибки.
+        :return: Tuple из статуса, типа содержимого и тела ответа.
+        """
+        return status, self.content_types['stats'], json.dumps({'error': message}, ensure_ascii=False).encode()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080, unix_path: str = None):
+        """Запускает сервер на TCP порту или Unix сокете и обслуживает запросы до остановки.
+
+        :param host: Адрес.
+        :param port: Порт.
+        :param unix_path: Путь к Unix сокету. Если задан, host и port не используются.
+        """
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        logger.info('Сервис отчётов слушает %s', unix_path or f'{host}:{port}')
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сервис отчётов по выгрузке вакансий, загруженной в память.')
+    parser.add_argument('file', help='csv файл с вакансиями')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес')
+    parser.add_argument('--port', type=int, default=8080, help='порт')
+    parser.add_argument('--unix', help='путь к Unix сокету вместо TCP порта')
+    parser.add_argument('--cache', help='папка дискового кэша колонок')
+    parser.add_argument('--rates', help='csv файл курсов валют по периодам')
+    parser.add_argument('--cache-entries', type=int, default=256, help='количество ответов в LRU кэше')
+    parser.add_argument('--cache-mb', type=int, default=64, help='размер LRU кэша ответов в мегабайтах')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='количество потоков подсчёта')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    rates = CurrencyRates.load(args.rates) if args.rates else None
+    options = {'cache': ColumnsCache(args.cache)} if args.cache else {'columnar': True}
+    data = DataSet(args.file, '', indexed=True, rates=rates, **options)
+    service = ReportService(data, ResultCache(args.cache_entries, args.cache_mb << 20), args.workers)
+    asyncio.run(service.serve(args.host, args.port, args.unix))
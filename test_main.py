@@ -0,0 +1,577 @@
+import csv
+import io
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import openpyxl
+
+from benchmark import generate_vacancies
+from main import AggregateState, ColumnsCache, DataSet, MappedCsvReader, Metrics, RecordSchema, ReportTable
+from main import VacancyColumns
+from main import AhoCorasick, CurrencyRates, NameIndex, SalaryDistribution, VacancyFile, YearPartitions
+
+
+class ExportTestCase(unittest.TestCase):
+    """Общие методы тестов, которым нужны временные выгрузки."""
+
+    headers = ['name', 'description', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at']
+
+    def write_export(self, rows: list, terminator: str = '\r\n') -> str:
+        """Записывает выгрузку во временный файл.
+
+        :param rows: Строки после заголовков, уже в формате csv.
+        :param terminator: Конец строки.
+        :return: Имя файла.
+        """
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+        with file:
+            file.write(terminator.join([','.join(self.headers)] + rows) + terminator)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def sample_export(self, count_rows: int = 3000, seed: int = 0) -> str:
+        """Записывает синтетическую выгрузку benchmark.generate_vacancies во временный файл.
+
+        :param count_rows: Количество строк.
+        :param seed: Зерно генератора случайных чисел.
+        :return: Имя файла.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_name = os.path.join(directory, 'vacancies.csv')
+        generate_vacancies(file_name, count_rows, seed)
+        return file_name
+
+
+class MappedCsvReaderTest(ExportTestCase):
+    """Сравнение MappedCsvReader с модулем csv на выгрузках с нестандартными кавычками."""
+
+    @staticmethod
+    def expected(file_name: str) -> tuple:
+        """Записи и счётчики отброшенных строк при чтении модулем csv.
+
+        :param file_name: Имя файла.
+        :return: Tuple из списка записей (published_at - до месяца) и словаря отброшенных строк.
+        """
+        with open(file_name, newline='') as file:
+            reader = csv.reader(file)
+            schema = RecordSchema(next(reader))
+            records = [record[:-1] + (record[-1][:7],) for record in schema.records(reader)]
+        return records, schema.rejects
+
+    def read(self, file_name: str, block_size: int) -> tuple:
+        """Читает выгрузку через MappedCsvReader с заданным размером блока.
+
+        :param file_name: Имя файла.
+        :param block_size: Размер блока в байтах.
+        :return: Tuple из списка записей (published_at - до месяца) и словаря отброшенных строк.
+        """
+        reader = MappedCsvReader(file_name)
+        reader.block_size = block_size
+        schema = RecordSchema(reader.headers)
+        records = [record[:-1] + (record[-1][:7],) for record in reader.records(schema)]
+        return records, schema.rejects
+
+    def test_stray_quote_before_multiline_fields(self):
+        """Кавычка внутри поля без кавычек не сдвигает границы блоков внутрь многострочных полей."""
+        rows = ['Stray 5" pipe,plain,100,200,RUR,Москва,2019-01-01T00:00:00+0300']
+        for index in range(300):
+            description = '"multi\nline, ""quoted""\ntext"' if index % 2 else 'x"y'
+            rows.append(f'Аналитик {index},{description},{index + 1},{index + 2},RUR,Омск,2020-02-01T00:00:00+0300')
+        file_name = self.write_export(rows)
+        expected = self.expected(file_name)
+        self.assertEqual(len(expected[0]), 301)
+        for block_size in (1 << 22, 4096, 64):
+            with self.subTest(block_size=block_size):
+                self.assertEqual(self.read(file_name, block_size), expected)
+
+    def test_carriage_return_line_ends(self):
+        """Выгрузка с концами строк CR читается так же, как модулем csv."""
+        rows = [f'Аналитик,"a\rb",{index + 1},{index + 2},RUR,Омск,2021-03-01T00:00:00+0300' for index in range(50)]
+        file_name = self.write_export(rows, terminator='\r')
+        expected = self.expected(file_name)
+        self.assertEqual(len(expected[0]), 50)
+        self.assertEqual(self.read(file_name, 64), expected)
+
+    def test_parallel_chunks_match_sequential(self):
+        """Части файла для процессов режутся по тем же границам записей, что и при последовательном чтении."""
+        rows = ['Stray 5" pipe,plain,100,200,RUR,Москва,2019-01-01T00:00:00+0300']
+        for index in range(300):
+            description = '"multi\nline\ntext"' if index % 3 else 'oops " mid'
+            year = 2010 + index % 5
+            rows.append(f'Аналитик,{description},{index + 1},{index + 2},RUR,Омск,{year}-02-01T00:00:00+0300')
+        file_name = self.write_export(rows)
+        sequential = DataSet(file_name, 'Аналитик', streaming=True)
+        for processes in (2, 4):
+            with self.subTest(processes=processes):
+                parallel = DataSet(file_name, 'Аналитик', processes=processes)
+                self.assertEqual(parallel.count_by_year_dict, sequential.count_by_year_dict)
+                self.assertEqual(parallel.salary_by_year_dict, sequential.salary_by_year_dict)
+                self.assertEqual(parallel.rejects, sequential.rejects)
+
+    def test_empty_file_without_header(self):
+        """Файл без заголовков - ошибка во всех режимах, включая разбор в нескольких процессах."""
+        file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        for options in ({}, {'streaming': True}, {'columnar': True}, {'processes': 2}):
+            with self.subTest(**options):
+                with self.assertRaisesRegex(Exception, 'В файле нет столбцов'):
+                    DataSet(file.name, 'Аналитик', **options)
+
+    def test_record_ends_skip_quoted_line_breaks(self):
+        """Концы записей не попадают внутрь полей в кавычках, даже после одиночной кавычки."""
+        data = b'a"b,c\n"x\ny",z\nq\n'
+        self.assertEqual(MappedCsvReader.record_ends(data, 0, len(data), [0, 7, 9]), [6, 14, 16])
+        self.assertEqual(list(csv.reader(io.StringIO(data.decode(), newline=''))),
+                         [['a"b', 'c'], ['x\ny', 'z'], ['q']])
+
+
+class DataSetModesTest(ExportTestCase):
+    """Проверка сочетаний режимов DataSet."""
+
+    def test_conflicting_modes_raise(self):
+        """Несовместимые режимы не отбрасываются молча, а приводят к исключению."""
+        file_name = self.sample_export(100)
+        for options in ({'cube': True, 'processes': 2}, {'cube': True, 'streaming': True},
+                        {'columnar': True, 'streaming': True}, {'compact': True, 'columnar': True}):
+            with self.subTest(**options):
+                with self.assertRaisesRegex(Exception, 'несовместимы'):
+                    DataSet(file_name, 'Аналитик', **options)
+
+    def test_indexed_needs_columns(self):
+        """Индекс названий включает колоночный режим и не сочетается с режимами без колонок."""
+        file_name = self.sample_export(100)
+        data_set = DataSet(file_name, 'Аналитик', indexed=True)
+        self.assertIsNotNone(data_set.columns)
+        self.assertIsNotNone(data_set.name_index)
+        for options in ({'streaming': True}, {'processes': 2}, {'cube': True}, {'compact': True}):
+            with self.subTest(**options):
+                with self.assertRaisesRegex(Exception, 'Индекс названий'):
+                    DataSet(file_name, 'Аналитик', indexed=True, **options)
+
+    def test_detail_stats_match_across_modes(self):
+        """Детальная статистика по списку вакансий совпадает с колоночной и кубом."""
+        file_name = self.sample_export()
+        expected = sorted(DataSet(file_name, 'Аналитик', columnar=True).detail_stats())
+        for options in ({}, {'compact': True}, {'cube': True}):
+            with self.subTest(**options):
+                self.assertEqual(sorted(DataSet(file_name, 'Аналитик', **options).detail_stats()), expected)
+
+    def test_single_mode_keeps_queries(self):
+        """Куб и колонки, выбранные одни, доступны для запросов без повторного чтения."""
+        file_name = self.sample_export(100)
+        for options in ({'cube': True}, {'columnar': True}):
+            with self.subTest(**options):
+                data_set = DataSet(file_name, 'Аналитик', **options)
+                self.assertEqual(data_set.query('Аналитик').count_by_year_dict, data_set.count_by_year_dict)
+
+
+class ProfessionsTest(ExportTestCase):
+    """Поиск нескольких профессий за один проход."""
+
+    professions = ['Программист', 'программист', 'Аналитик', 'аналитик', 'Системный аналитик', 'Java', 'а', '',
+                   'Инженер\nпрограммист', 'Менеджер, продажи', 'Нет такой профессии']
+
+    def test_aho_corasick_matches_substring_search(self):
+        """AhoCorasick находит те же образцы, что и проверка подстроки по каждому образцу."""
+        matcher = AhoCorasick(self.professions)
+        texts = {vacancy.name for vacancy in DataSet.read_vacancies(self.sample_export())}
+        texts |= {'', 'ааа', 'Системный аналитик Java', 'программист программист'}
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(matcher.find(text),
+                                 {index for index, pattern in enumerate(self.professions) if pattern in text})
+
+    def test_for_profession_matches_fresh_data_set(self):
+        """Статистика дополнительной профессии совпадает с отдельным DataSet по этой профессии."""
+        file_name = self.sample_export()
+        for options in ({}, {'streaming': True}, {'columnar': True}, {'cube': True}):
+            data_set = DataSet(file_name, 'Аналитик', professions=self.professions, **options)
+            for prof_name in self.professions:
+                with self.subTest(prof_name=prof_name, **options):
+                    selected, expected = data_set.for_profession(prof_name), DataSet(file_name, prof_name, **options)
+                    self.assertEqual(selected.count_by_year_name_dict, expected.count_by_year_name_dict)
+                    self.assertEqual(selected.salary_by_year_name_dict, expected.salary_by_year_name_dict)
+
+
+class NameIndexTest(ExportTestCase):
+    """Поиск профессии по триграммному индексу названий."""
+
+    queries = ['Аналитик', 'аналитик', 'Программист', 'ист', 'Ja', 'а', '', 'Инженер\nпрограммист', ', про',
+               'Нет такой профессии', 'Data Scientist']
+
+    def test_rows_match_substring_search(self):
+        """Индекс находит те же строки, что и проверка подстроки в каждом названии."""
+        columns = DataSet(self.sample_export(), '', columnar=True).columns
+        index = NameIndex.build(columns)
+        for query in self.queries:
+            with self.subTest(query=query):
+                expected = [row for row, code in enumerate(columns.name) if query in columns.names[code]]
+                self.assertEqual(index.rows(query).tolist(), expected)
+
+    def test_select_profession_matches_fresh_data_set(self):
+        """select_profession с индексом, без него и с кубом даёт ту же статистику, что и новый DataSet."""
+        file_name = self.sample_export()
+        for options in ({'indexed': True}, {'columnar': True}, {'cube': True}):
+            data_set = DataSet(file_name, 'Аналитик', **options)
+            for query in self.queries:
+                with self.subTest(query=query, **options):
+                    selected, expected = data_set.select_profession(query), DataSet(file_name, query)
+                    self.assertEqual(selected.count_by_year_name_dict, expected.count_by_year_name_dict)
+                    for year, salary in expected.salary_by_year_name_dict.items():
+                        self.assertAlmostEqual(selected.salary_by_year_name_dict[year], salary, delta=1)
+                    self.assertEqual(selected.count_by_year_dict, expected.count_by_year_dict)
+
+
+class CurrencyRatesTest(ExportTestCase):
+    """Пакетный подбор курсов против курса для одной вакансии."""
+
+    rates = CurrencyRates(periodic={'2010': {'USD': 30.0, 'EUR': 40.0}, '2010-05': {'USD': 31.5},
+                                    '2012-03': {'EUR': 50.0, 'KZT': 0.2}, '2015': {'UAH': 2.5}})
+
+    def test_rates_for_matches_rate(self):
+        """rates_for подбирает для каждой вакансии тот же курс, что и rate: месяц, затем год, затем фиксированный."""
+        rnd = random.Random(0)
+        currencies = ['RUR', 'USD', 'EUR', 'KZT', 'UAH']
+        currency = np.array([rnd.randrange(len(currencies)) for _ in range(2000)])
+        year = np.array([rnd.randint(2008, 2016) for _ in range(2000)], dtype=np.int16)
+        month = np.array([rnd.randint(1, 12) for _ in range(2000)], dtype=np.int64)
+        expected = [self.rates.rate(currencies[code], f'{y}-{m:02}-01T00:00:00+0300')
+                    for code, y, m in zip(currency, year, month)]
+        self.assertEqual(self.rates.rates_for(currencies, currency, year, month).tolist(), expected)
+
+    def test_unknown_currency_raises(self):
+        """Валюта без курса - ошибка и при пакетном подборе, и для одной вакансии."""
+        with self.assertRaises(KeyError):
+            self.rates.rate('XXX', '2010-05-01')
+        with self.assertRaises(KeyError):
+            self.rates.rates_for(['RUR', 'XXX'], np.array([0, 1]), np.array([2010, 2010]), np.array([5, 5]))
+
+    def test_columnar_matches_per_vacancy(self):
+        """ЗП, пересчитанные пакетно в колоночном режиме, совпадают с пересчётом по вакансиям."""
+        file_name = self.sample_export()
+        columnar = DataSet(file_name, 'Аналитик', columnar=True, rates=self.rates)
+        expected = DataSet(file_name, 'Аналитик', rates=self.rates)
+        self.assertEqual(columnar.count_by_year_dict, expected.count_by_year_dict)
+        for year, salary in expected.salary_by_year_dict.items():
+            self.assertAlmostEqual(columnar.salary_by_year_dict[year], salary, delta=1)
+        self.assertNotEqual(expected.salary_by_year_dict, DataSet(file_name, 'Аналитик').salary_by_year_dict)
+
+
+class SalaryCubeTest(ExportTestCase):
+    """Срезы куба против словарей DataSet и перебора вакансий."""
+
+    def test_roll_up_matches_data_set(self):
+        """Свёртка куба по годам и городам совпадает с итоговыми словарями обычного режима."""
+        file_name = self.sample_export()
+        cube = DataSet(file_name, 'Аналитик', cube=True).cube
+        expected = DataSet(file_name, 'Аналитик')
+        self.assertEqual(cube.count('year'), expected.count_by_year_dict)
+        for year, salary in cube.salary('year').items():
+            self.assertAlmostEqual(salary, expected.salary_by_year_dict[year], delta=1)
+        for city, salary in expected.salary_by_all_cities_dict.items():
+            self.assertAlmostEqual(cube.salary('city')[city], salary, delta=1)
+        by_year_name = cube.profession('Аналитик').count('year')
+        self.assertEqual({year: by_year_name.get(year, 0) for year in expected.years},
+                         expected.count_by_year_name_dict)
+        self.assertEqual(sum(count for _, count in cube.roll_up().values()), sum(expected.count_by_year_dict.values()))
+
+    def test_slice_and_dice_match_vacancies(self):
+        """slice и dice оставляют те же вакансии, что и отбор перебором."""
+        file_name = self.sample_export()
+        cube = DataSet(file_name, 'Аналитик', cube=True).cube
+        vacancies = list(DataSet.read_vacancies(file_name))
+        in_moscow = {}
+        for vacancy in vacancies:
+            if vacancy.area_name == 'Москва':
+                in_moscow[vacancy.year] = in_moscow.get(vacancy.year, 0) + 1
+        self.assertEqual(cube.slice('city', 'Москва').count('year'), in_moscow)
+        cities, years = {'Москва', 'Казань'}, range(2010, 2014)
+        diced = {}
+        for vacancy in vacancies:
+            if vacancy.area_name in cities and vacancy.year in years:
+                key = (vacancy.year, vacancy.area_name)
+                diced[key] = diced.get(key, 0) + 1
+        self.assertTrue(diced)
+        self.assertEqual(cube.dice(year=years, city=cities).count('year', 'city'), diced)
+        self.assertEqual(len(cube.dice(year=lambda year: year > 3000)), 0)
+
+
+class SalaryDistributionTest(ExportTestCase):
+    """Квантили и слияние скетча распределения ЗП."""
+
+    levels = (0.0, 0.01, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0)
+
+    def salaries(self) -> list:
+        """ЗП вакансий синтетической выгрузки.
+
+        :return: Массив ЗП в рублях.
+        """
+        return [vacancy.salary for vacancy in DataSet.read_vacancies(self.sample_export())]
+
+    def test_quantile_within_relative_accuracy(self):
+        """Квантиль отличается от точного не больше, чем на relative_accuracy."""
+        salaries = self.salaries()
+        distribution = SalaryDistribution()
+        for salary in salaries:
+            distribution.add(salary)
+        exact = sorted(salaries)
+        for level in self.levels:
+            with self.subTest(level=level):
+                expected = exact[math.floor(level * (len(exact) - 1))]
+                self.assertLessEqual(abs(distribution.quantile(level) - expected),
+                                     SalaryDistribution.relative_accuracy * expected + 1e-6)
+        self.assertEqual(SalaryDistribution().quantile(0.5), 0.0)
+
+    def test_merge_and_add_array_match_add(self):
+        """Слияние распределений частей и пакетное добавление дают то же распределение, что и по одной ЗП."""
+        salaries = self.salaries() + [0.0]
+        whole, first, second = SalaryDistribution(), SalaryDistribution(), SalaryDistribution()
+        for salary in salaries:
+            whole.add(salary)
+        for salary in salaries[:len(salaries) // 3]:
+            first.add(salary)
+        second.add_array(np.array(salaries[len(salaries) // 3:]))
+        merged = first.merge(second)
+        self.assertEqual((merged.count, merged.zeros, merged.buckets, merged.bins),
+                         (whole.count, whole.zeros, whole.buckets, whole.bins))
+        self.assertEqual([merged.quantile(level) for level in self.levels],
+                         [whole.quantile(level) for level in self.levels])
+        self.assertEqual(sum(merged.histogram()), len(salaries))
+
+
+class AggregateStateTest(ExportTestCase):
+    """Накопление выгрузок в AggregateState."""
+
+    def test_merged_files_match_whole_export(self):
+        """Две выгрузки, добавленные по очереди и пережившие сохранение, дают ту же статистику,
+        что и одна выгрузка из их строк; повторное добавление файла игнорируется."""
+        first, second = self.sample_export(2000, seed=1), self.sample_export(1500, seed=2)
+        whole = self.sample_export(0)
+        with open(whole, 'w', encoding='utf-8', newline='') as output:
+            for file_name in (first, second):
+                with open(file_name, encoding='utf-8', newline='') as file:
+                    lines = file.read().split('\n', 1)
+                output.write(lines[1] if file_name == second else '\n'.join(lines))
+        state = AggregateState()
+        self.assertTrue(state.add_file(first))
+        self.assertTrue(state.add_file(second))
+        self.assertFalse(state.add_file(first))
+        state_file = os.path.join(os.path.dirname(whole), 'state.json')
+        state.save(state_file)
+        merged = DataSet.from_aggregates(AggregateState.load(state_file), 'Аналитик')
+        expected = DataSet(whole, 'Аналитик')
+        self.assertEqual(merged.count_by_year_dict, expected.count_by_year_dict)
+        self.assertEqual(merged.count_by_year_name_dict, expected.count_by_year_name_dict)
+        self.assertEqual(merged.percent_by_city_dict, expected.percent_by_city_dict)
+        for year, salary in expected.salary_by_year_dict.items():
+            self.assertAlmostEqual(merged.salary_by_year_dict[year], salary, delta=1)
+
+    def test_same_size_change_outside_sampled_blocks(self):
+        """Выгрузка того же размера, отличающаяся вне выборочных блоков ColumnsCache.fingerprint, - новая."""
+        first = self.sample_export(40000)
+        with open(first, 'rb') as file:
+            data = bytearray(file.read())
+        block_size, count_blocks = 1 << 16, 16
+        position = block_size + (len(data) - block_size) // count_blocks // 2
+        self.assertGreater((len(data) - block_size) // count_blocks, block_size * 2)
+        position = data.index(b'000', position)
+        data[position] = ord('1') if data[position] != ord('1') else ord('2')
+        second = os.path.join(os.path.dirname(first), 'changed.csv')
+        with open(second, 'wb') as file:
+            file.write(data)
+        self.assertEqual(ColumnsCache.fingerprint(first)['content'], ColumnsCache.fingerprint(second)['content'])
+        state = AggregateState()
+        self.assertTrue(state.add_file(first))
+        self.assertTrue(state.add_file(second))
+        self.assertEqual(len(state.sources), 2)
+
+
+class VacancyFileTest(ExportTestCase):
+    """Преобразование выгрузки в колоночный файл и загрузка из него."""
+
+    def assertSameStats(self, data_set: DataSet, expected: DataSet):
+        """Проверяет, что итоговые словари и отброшенные строки двух наборов данных совпадают.
+
+        :param data_set: Проверяемый набор данных.
+        :param expected: Ожидаемый набор данных.
+        """
+        for name in ('count_by_year_dict', 'salary_by_year_dict', 'count_by_year_name_dict',
+                     'salary_by_year_name_dict', 'salary_by_city_dict', 'percent_by_city_dict', 'rejects'):
+            self.assertEqual(getattr(data_set, name), getattr(expected, name), name)
+
+    def test_round_trip_matches_csv(self):
+        """Загрузка из колоночного файла, целиком и по годам, совпадает с колоночным разбором csv."""
+        file_name = self.sample_export()
+        vacancy_file = VacancyFile.convert(file_name, file_name + '.npz')
+        self.assertTrue(VacancyFile.is_vacancy_file(vacancy_file.file_name))
+        self.assertFalse(VacancyFile.is_vacancy_file(file_name))
+        self.assertSameStats(DataSet(vacancy_file.file_name, 'Аналитик'), DataSet(file_name, 'Аналитик', columnar=True))
+        for years in ((2010, 2014), (2022, 2030), (2030, 2040)):
+            with self.subTest(years=years):
+                self.assertEqual(DataSet(vacancy_file.file_name, 'Аналитик', years=years).count_by_year_dict,
+                                 DataSet(file_name, 'Аналитик', columnar=True, years=years).count_by_year_dict)
+        arrays = vacancy_file.read(('salary', 'currency'), (2010, 2010))
+        self.assertEqual(list(arrays), ['salary', 'currency'])
+        self.assertEqual(len(arrays['salary']), dict(vacancy_file.select_years())[2010])
+
+    def test_refuses_other_rates(self):
+        """Файл, пересчитанный по одним курсам, не загружается с другими."""
+        file_name = self.sample_export(500)
+        rates = CurrencyRates(periodic={'2010': {'USD': 30.0}})
+        VacancyFile.convert(file_name, file_name + '.npz', rates)
+        with self.assertRaisesRegex(Exception, 'другим курсам'):
+            DataSet(file_name + '.npz', 'Аналитик')
+        self.assertSameStats(DataSet(file_name + '.npz', 'Аналитик', rates=rates),
+                             DataSet(file_name, 'Аналитик', columnar=True, rates=rates))
+
+
+class YearPartitionsTest(ExportTestCase):
+    """Разбиение выгрузки по годам и чтение разбиения."""
+
+    def test_partitions_match_whole_file(self):
+        """Чтение разбиения, целиком, по годам и в нескольких процессах, совпадает с чтением исходного файла."""
+        file_name = self.sample_export()
+        directory = os.path.join(os.path.dirname(file_name), 'years')
+        partitions = YearPartitions.split(file_name, directory)
+        self.assertTrue(YearPartitions.is_partitioned(directory))
+        self.assertEqual(partitions.years, list(DataSet(file_name, '', streaming=True).count_by_year_dict))
+        for options in ({'streaming': True}, {'processes': 2}, {'columnar': True}):
+            for years in (None, (2010, 2014)):
+                with self.subTest(years=years, **options):
+                    data_set = DataSet(directory, 'Аналитик', years=years, **options)
+                    expected = DataSet(file_name, 'Аналитик', years=years, **options)
+                    self.assertEqual(data_set.count_by_year_dict, expected.count_by_year_dict)
+                    self.assertEqual(data_set.salary_by_year_name_dict, expected.salary_by_year_name_dict)
+                    self.assertEqual(data_set.percent_by_city_dict, expected.percent_by_city_dict)
+                    if years is None:
+                        self.assertEqual(data_set.rejects, expected.rejects)
+
+    def test_split_again_removes_stale_years(self):
+        """Повторное разбиение в ту же папку удаляет файлы годов, которых больше нет."""
+        directory = os.path.join(os.path.dirname(self.sample_export(100)), 'years')
+        YearPartitions.split(self.sample_export(), directory)
+        rows = ['Аналитик,,100,200,RUR,Омск,2015-01-01T00:00:00+0300']
+        partitions = YearPartitions.split(self.write_export(rows), directory)
+        self.assertEqual(partitions.years, [2015])
+        self.assertEqual(sorted(os.listdir(directory)), ['2015.csv', YearPartitions.manifest])
+
+
+class ColumnsCacheTest(ExportTestCase):
+    """Попадания, инвалидация и вытеснение записей дискового кэша колонок."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.built = []
+
+    def build(self, file_name: str):
+        """Функция разбора файла для ColumnsCache.get, запоминающая каждый вызов.
+
+        :param file_name: Имя файла.
+        :return: Функция без аргументов.
+        """
+        def build():
+            self.built.append(file_name)
+            reader = MappedCsvReader(file_name)
+            schema = RecordSchema(reader.headers)
+            columns = VacancyColumns.from_records(reader.records(schema), CurrencyRates())
+            return columns, (schema.accepted, schema.rejects)
+        return build
+
+    def entries(self) -> list:
+        """Папки записей кэша.
+
+        :return: Отсортированный список имён.
+        """
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_hit_and_invalidation(self):
+        """Повторное чтение берёт колонки и счётчики из кэша, изменённый файл разбирается заново,
+        а запись прошлой версии удаляется."""
+        file_name = self.sample_export()
+        cache = ColumnsCache(self.cache_dir)
+        columns, counters = cache.get(file_name, self.build(file_name))
+        cached, cached_counters = cache.get(file_name, self.build(file_name))
+        self.assertEqual(len(self.built), 1)
+        self.assertEqual(cached_counters, counters)
+        self.assertEqual((cached.salary.tolist(), cached.names), (columns.salary.tolist(), columns.names))
+        self.assertEqual(DataSet(file_name, 'Аналитик', cache=cache).rejects,
+                         DataSet(file_name, 'Аналитик', columnar=True).rejects)
+        self.assertEqual(len(self.built), 1)
+        entries = self.entries()
+        with open(file_name, 'a', encoding='utf-8', newline='') as file:
+            file.write('Аналитик,100,200,RUR,Омск,2015-01-01T00:00:00+0300\r\n')
+        _, (accepted, _) = cache.get(file_name, self.build(file_name))
+        self.assertEqual((len(self.built), accepted), (2, counters[0] + 1))
+        self.assertEqual(len(self.entries()), 1)
+        self.assertNotEqual(self.entries(), entries)
+
+    def test_evicts_least_recently_read(self):
+        """Кэш больше max_bytes освобождается от давно не читавшихся записей."""
+        files = [self.sample_export(1000, seed) for seed in range(3)]
+        cache = ColumnsCache(self.cache_dir)
+        cache.get(files[0], self.build(files[0]))
+        entry_bytes = sum(os.path.getsize(os.path.join(self.cache_dir, self.entries()[0], name))
+                          for name in os.listdir(os.path.join(self.cache_dir, self.entries()[0])))
+        cache.max_bytes = entry_bytes * 5 // 2
+        cache.get(files[1], self.build(files[1]))
+        time.sleep(0.01)
+        cache.get(files[0], self.build(files[0]))
+        time.sleep(0.01)
+        cache.get(files[2], self.build(files[2]))
+        self.assertEqual(len(self.entries()), 2)
+        cache.get(files[0], self.build(files[0]))
+        cache.get(files[2], self.build(files[2]))
+        self.assertEqual(self.built, [files[0], files[1], files[2]])
+        cache.get(files[1], self.build(files[1]))
+        self.assertEqual(self.built[-1], files[1])
+
+
+class ReportTableTest(ExportTestCase):
+    """Потоковая запись листов EXCEL."""
+
+    def test_write_sheet_reads_rows_once(self):
+        """Строки перебираются один раз, но попадают в лист целиком, а ширины столбцов считаются по ним."""
+        rows = ([index, 'x' * (index % 40)] for index in range(ReportTable.spool_step * 2 + 5))
+        file_name = os.path.join(tempfile.mkdtemp(), 'sheet.xlsx')
+        self.addCleanup(shutil.rmtree, os.path.dirname(file_name))
+        wb = openpyxl.Workbook(write_only=True)
+        ReportTable(None).write_sheet(wb, 'Лист', ['Номер', 'Текст'], rows)
+        wb.save(file_name)
+        ws = openpyxl.load_workbook(file_name).active
+        self.assertEqual(ws.max_row, ReportTable.spool_step * 2 + 6)
+        self.assertEqual([ws.cell(row, 1).value for row in (2, ws.max_row)], [0, ReportTable.spool_step * 2 + 4])
+        self.assertEqual(ws.column_dimensions['B'].width, 39 + 3)
+
+
+class MetricsTest(unittest.TestCase):
+    """Замеры памяти по стадиям."""
+
+    def test_traced_peak_per_stage(self):
+        """Пик стадии - её собственный, а вложенная стадия не стирает пик внешней."""
+        metrics = Metrics(trace_memory=True)
+        with metrics.stage('outer'):
+            data = bytearray(8 << 20)
+            del data
+            with metrics.stage('inner'):
+                data = bytearray(1 << 20)
+                del data
+        with metrics.stage('small'):
+            data = bytearray(1 << 10)
+            del data
+        stages = metrics.stages
+        self.assertGreaterEqual(stages['outer']['peak_traced_kb'], 8 << 10)
+        self.assertTrue(1 << 10 <= stages['inner']['peak_traced_kb'] < 2 << 10)
+        self.assertLess(stages['small']['peak_traced_kb'], 1 << 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
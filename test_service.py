@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from benchmark import generate_vacancies
+from main import DataSet
+from service import ReportService, ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+    """Вытеснение записей LRU кэша ответов."""
+
+    def test_evicts_least_recently_used_by_count(self):
+        """При превышении количества записей вытесняется давно не использованная."""
+        cache = ResultCache(max_entries=2, max_bytes=100)
+        cache.put('a', ('text', b'1'))
+        cache.put('b', ('text', b'2'))
+        self.assertEqual(cache.get('a'), ('text', b'1'))
+        cache.put('c', ('text', b'3'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get('a'), cache.get('c')], [('text', b'1'), ('text', b'3')])
+        self.assertEqual((len(cache), cache.size, cache.hits, cache.misses), (2, 2, 3, 1))
+
+    def test_evicts_by_bytes(self):
+        """Суммарный размер не превышает лимита, ответ больше лимита не кэшируется, замена учитывает размер."""
+        cache = ResultCache(max_entries=10, max_bytes=10)
+        cache.put('a', ('text', b'x' * 4))
+        cache.put('b', ('text', b'x' * 4))
+        cache.put('c', ('text', b'x' * 4))
+        self.assertEqual((len(cache), cache.size), (2, 8))
+        self.assertIsNone(cache.get('a'))
+        cache.put('b', ('text', b'x'))
+        self.assertEqual((len(cache), cache.size), (2, 5))
+        cache.put('big', ('text', b'x' * 11))
+        self.assertIsNone(cache.get('big'))
+        self.assertEqual((len(cache), cache.size), (2, 5))
+
+
+class ReportServiceTest(unittest.IsolatedAsyncioTestCase):
+    """Ответы сервиса на небольшой выгрузке в колоночном режиме."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        file_name = os.path.join(cls.directory, 'vacancies.csv')
+        generate_vacancies(file_name, 2000)
+        cls.data_set = DataSet(file_name, '', indexed=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.service = ReportService(self.data_set, ResultCache(), workers=4)
+        self.addCleanup(self.service.executor.shutdown)
+
+    async def test_stats_match_query(self):
+        """Статистика в json совпадает с DataSet.query, повторный запрос отвечается из кэша."""
+        status, content_type, body = await self.service.dispatch('GET', '/stats?profession=Аналитик&years=2010-2015')
+        self.assertEqual((status, content_type), ('200 OK', ReportService.content_types['stats']))
+        expected = self.data_set.query('Аналитик', years=(2010, 2015))
+        self.assertEqual(json.loads(body)['count_by_year_name'],
+                         {str(year): count for year, count in expected.count_by_year_name_dict.items()})
+        self.assertEqual(await self.service.dispatch('GET', '/stats?profession=Аналитик&years=2010-2015'),
+                         (status, content_type, body))
+        self.assertEqual((self.service.cache.hits, self.service.cache.misses), (1, 1))
+
+    async def test_concurrent_requests_build_once(self):
+        """Одинаковые одновременные запросы считаются один раз и получают один ответ."""
+        calls = []
+        build = self.service.build
+
+        def slow_build(*key):
+            calls.append(key)
+            time.sleep(0.05)
+            return build(*key)
+
+        self.service.build = slow_build
+        responses = await asyncio.gather(*(self.service.dispatch('GET', '/stats?profession=Программист')
+                                           for _ in range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(responses)), 1)
+        self.assertEqual(len(self.service.cache), 1)
+
+    async def test_errors(self):
+        """Неверные параметры - 400, неизвестный путь и пустой отчёт - 404, не GET - 405."""
+        for method, target, status in (('GET', '/stats', '400 Bad Request'),
+                                       ('GET', '/stats?profession=Аналитик&years=abc', '400 Bad Request'),
+                                       ('GET', '/unknown?profession=Аналитик', '404 Not Found'),
+                                       ('GET', '/graph.png?profession=Аналитик&city=Нигде', '404 Not Found'),
+                                       ('POST', '/stats?profession=Аналитик', '405 Method Not Allowed')):
+            with self.subTest(method=method, target=target):
+                response_status, content_type, body = await self.service.dispatch(method, target)
+                self.assertEqual(response_status, status)
+                self.assertIn('error', json.loads(body))
+        self.assertEqual(len(self.service.cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()